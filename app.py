@@ -1,10 +1,18 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
+from flask.cli import AppGroup
 from flask_session import Session
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+import click
+import os
 import uuid
 from datetime import datetime, timedelta
 
 from config import Config
-from models import db, UserSession, Conversation, CrisisLog
+from models import db, UserSession, Conversation, CrisisLog, JournalEntryTag
+from models.schema import upgrade_schema
+from models.journal_entry import DECRYPTABLE_FIELDS
+from models.journal_fts import JournalFTS
 from services.gemini_service import GeminiService
 from services.language_service import LanguageService
 from services.wellness_tracker import WellnessTracker
@@ -12,12 +20,17 @@ from services.helpline_service import HelplineService
 from services.micro_plan_service import MicroPlanService
 from services.myths_facts_service import MythsFactsService
 from services.journal_service import JournalService
+from services.journal_crypto import JournalCrypto
 from services.badge_service import BadgeService
 from services.study_timer_service import StudyTimerService
+from services.event_bus import EventBus
+from services.badge_worker import BadgeWorker
+from services.notification_scheduler import NotificationScheduler
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    JournalCrypto.check_master_key(app)
 
     # Initialize extensions
     db.init_app(app)
@@ -25,7 +38,15 @@ def create_app():
 
     # Create database tables
     with app.app_context():
+        new_tables = set(db.metadata.tables) - set(inspect(db.engine).get_table_names())
         db.create_all()
+        upgrade_schema(new_tables)
+        JournalFTS.setup()
+        JournalEntryTag.backfill()
+
+    BadgeWorker.init_app(app)
+    NotificationScheduler.init_app(app)
+    BadgeService.register_event_handlers()
 
     # Helper function to get or create session
     def get_or_create_session():
@@ -101,9 +122,23 @@ def create_app():
         conv = Conversation(session_id=session_id, message=user_message, response=response_text, language=language, crisis_detected=crisis_detected)
         db.session.add(conv)
         db.session.commit()
+        EventBus.publish(session_id, 'chat_message', {'conversation_id': conv.id})
 
         return jsonify({'response': response_text, 'crisis': crisis_detected, 'detected_language': language})
 
+    @app.route('/api/conversations')
+    def get_conversation_history():
+        session_id = get_or_create_session()
+        limit = min(int(request.args.get('limit', 20)), 100)
+        offset = int(request.args.get('offset', 0))
+
+        try:
+            conversations, next_cursor = Conversation.get_history_page(session_id, limit,
+                                                                       request.args.get('cursor'), offset)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return jsonify({'conversations': [conv.to_dict() for conv in conversations], 'next_cursor': next_cursor})
+
     @app.route('/resources/<persona>')
     def resources(persona):
         get_or_create_session()
@@ -138,7 +173,10 @@ def create_app():
         # Aggregate anonymized data
         total_crises = len(crisis_logs)
         escalated = sum(1 for log in crisis_logs if log['escalated'])
-        return render_template('gatekeeper.html', total_crises=total_crises, escalated=escalated)
+        # Read from the stored funnels, rebuilt here once they are older than FUNNEL_REFRESH_INTERVAL
+        plan_funnels = MicroPlanService().get_funnels()
+        return render_template('gatekeeper.html', total_crises=total_crises, escalated=escalated,
+                               plan_funnels=plan_funnels)
 
     @app.route('/set_persona', methods=['POST'])
     def set_persona():
@@ -221,6 +259,38 @@ def create_app():
             return jsonify({'success': success})
         except ValueError as e:
             return jsonify({'success': False, 'error': str(e)}), 400
+        except IntegrityError:
+            return jsonify({'success': False, 'error': 'Tasks were completed by another request, please retry'}), 409
+
+    @app.route('/api/micro-plans/tasks/complete', methods=['POST'])
+    def complete_micro_plan_tasks():
+        session_id = get_or_create_session()
+        data = request.get_json()
+        plan_id = data.get('plan_id')
+        tasks = data.get('tasks')
+
+        if not plan_id or not isinstance(tasks, list) or not tasks:
+            return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
+
+        try:
+            pairs = [(int(task['day']), task['task_id']) for task in tasks]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Each task needs a day and a task_id'}), 400
+
+        try:
+            micro_plan_svc = MicroPlanService()
+            completed = micro_plan_svc.mark_tasks_complete(session_id, plan_id, pairs)
+            return jsonify({'success': True, 'completed': completed})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except IntegrityError:
+            return jsonify({'success': False, 'error': 'Tasks were completed by another request, please retry'}), 409
+
+    @app.route('/api/analytics/micro-plans/funnels')
+    def get_micro_plan_funnels():
+        # In a real app, check authentication
+        funnels = MicroPlanService().get_funnels()
+        return jsonify({'funnels': funnels})
 
     @app.route('/api/mood/reminder/check')
     def check_mood_reminder():
@@ -260,6 +330,27 @@ def create_app():
 
         return jsonify({'nudges': pending_nudges})
 
+    @app.route('/api/events/stream')
+    def event_stream():
+        session_id = get_or_create_session()
+        # Event types the page handles, e.g. ?types=nudge,badge_awarded; all of them if omitted
+        types = {event_type for event_type in request.args.get('types', '').split(',') if event_type}
+
+        stream = EventBus.stream(
+            session_id,
+            timeout=app.config['EVENT_STREAM_TIMEOUT'],
+            heartbeat=app.config['EVENT_STREAM_HEARTBEAT'],
+            on_connect=lambda: (StudyTimerService.publish_status(session_id),
+                                NotificationScheduler.check_session(session_id)),
+            max_streams=app.config['EVENT_STREAM_MAX_CLIENTS'],
+            types=types
+        )
+
+        return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
     @app.route('/api/nudges/schedule', methods=['POST'])
     def schedule_nudge():
         session_id = get_or_create_session()
@@ -337,9 +428,16 @@ def create_app():
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
         decrypt = request.args.get('decrypt', 'true').lower() == 'true'
+        # e.g. ?fields=title for list views that do not show the entry body
+        fields = tuple(field for field in request.args.get('fields', 'title,content').split(',')
+                       if field in DECRYPTABLE_FIELDS)
 
-        entries = JournalService.get_entries(session_id, limit, offset, decrypt)
-        return jsonify({'entries': [entry.to_dict() for entry in entries]})
+        try:
+            entries, next_cursor = JournalService.get_entries_page(session_id, limit, request.args.get('cursor'),
+                                                                   offset, decrypt, fields)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return jsonify({'entries': [entry.to_dict() for entry in entries], 'next_cursor': next_cursor})
 
     @app.route('/api/journal/entry', methods=['POST'])
     def create_journal_entry():
@@ -356,9 +454,6 @@ def create_app():
             encrypt=data.get('encrypt', True)
         )
 
-        # Check for badges
-        BadgeService.check_and_award_badges(session_id)
-
         return jsonify({'success': True, 'entry': entry.to_dict()})
 
     @app.route('/api/journal/entry/<entry_id>', methods=['GET'])
@@ -411,8 +506,43 @@ def create_app():
         if not query:
             return jsonify({'error': 'Search query required'}), 400
 
-        entries = JournalService.search_entries(session_id, query, decrypt)
-        return jsonify({'entries': [entry.to_dict() for entry in entries]})
+        limit = min(int(request.args.get('limit', 20)), 100)
+        try:
+            page = JournalService.search_entries(session_id, query, decrypt, limit, request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        entries = []
+        for entry in page['entries']:
+            entry_data = entry.to_dict()
+            entry_data['snippet'] = page['snippets'].get(entry.id)
+            entries.append(entry_data)
+
+        return jsonify({'entries': entries, 'next_cursor': page['next_cursor']})
+
+    @app.route('/api/journal/export')
+    def export_journal_entries():
+        session_id = get_or_create_session()
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'zip'):
+            return jsonify({'error': 'Format must be ndjson or zip'}), 400
+
+        try:
+            start_date = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+            end_date = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return jsonify({'error': 'Dates must be ISO 8601'}), 400
+
+        filename = f"journal-{datetime.utcnow().strftime('%Y%m%d')}.{'zip' if export_format == 'zip' else 'ndjson'}"
+        if export_format == 'zip':
+            stream = JournalService.stream_export_zip(session_id, start_date, end_date)
+            mimetype = 'application/zip'
+        else:
+            stream = JournalService.stream_export_ndjson(session_id, start_date, end_date)
+            mimetype = 'application/x-ndjson'
+
+        return Response(stream_with_context(stream), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
     @app.route('/api/journal/stats')
     def get_journal_stats():
@@ -444,6 +574,14 @@ def create_app():
         earned_badges = BadgeService.check_and_award_badges(session_id)
         return jsonify({'earned_badges': earned_badges})
 
+    @app.route('/api/badges/new')
+    def get_new_badges():
+        session_id = get_or_create_session()
+        cursor = int(request.args.get('since', 0))
+
+        result = BadgeService.get_new_badges(session_id, cursor)
+        return jsonify(result)
+
     @app.route('/api/badges/stats')
     def get_badge_stats():
         session_id = get_or_create_session()
@@ -451,6 +589,14 @@ def create_app():
         stats = BadgeService.get_badge_stats(session_id)
         return jsonify({'stats': stats})
 
+    @app.route('/api/badges/popular')
+    def get_popular_badges():
+        return jsonify({'badges': BadgeService.get_popular_badges()})
+
+    @app.route('/api/badges/rare')
+    def get_rare_badges():
+        return jsonify({'badges': BadgeService.get_rare_badges()})
+
     # Study Timer routes
     @app.route('/study_timer')
     def study_timer():
@@ -471,9 +617,6 @@ def create_app():
         if not session:
             return jsonify({'success': False, 'error': message}), 400
 
-        # Check for badges
-        BadgeService.check_and_award_badges(session_id)
-
         return jsonify({
             'success': True,
             'session': session.to_dict(),
@@ -495,9 +638,6 @@ def create_app():
         if not session:
             return jsonify({'success': False, 'error': message}), 400
 
-        # Check for badges
-        BadgeService.check_and_award_badges(session_id)
-
         return jsonify({
             'success': True,
             'session': session.to_dict(),
@@ -523,6 +663,23 @@ def create_app():
         return jsonify({
             'success': True,
             'session': session.to_dict(),
+            'status': StudyTimerService.get_session_status(session_id),
+            'message': message
+        })
+
+    @app.route('/api/study/resume', methods=['POST'])
+    def resume_study_session():
+        session_id = get_or_create_session()
+
+        session, message = StudyTimerService.resume_session(session_id)
+
+        if not session:
+            return jsonify({'success': False, 'error': message}), 400
+
+        return jsonify({
+            'success': True,
+            'session': session.to_dict(),
+            'status': StudyTimerService.get_session_status(session_id),
             'message': message
         })
 
@@ -532,8 +689,12 @@ def create_app():
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
 
-        sessions = StudyTimerService.get_user_sessions(session_id, limit, offset)
-        return jsonify({'sessions': [session.to_dict() for session in sessions]})
+        try:
+            sessions, next_cursor = StudyTimerService.get_user_sessions_page(session_id, limit,
+                                                                             request.args.get('cursor'), offset)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return jsonify({'sessions': [session.to_dict() for session in sessions], 'next_cursor': next_cursor})
 
     @app.route('/api/study/stats')
     def get_study_stats():
@@ -543,6 +704,14 @@ def create_app():
         stats = StudyTimerService.get_study_stats(session_id, days)
         return jsonify({'stats': stats})
 
+    @app.route('/api/study/heatmap')
+    def get_study_heatmap():
+        session_id = get_or_create_session()
+        days = min(max(int(request.args.get('days', 90)), 7), 365)
+
+        heatmap = StudyTimerService.get_study_heatmap(session_id, days)
+        return jsonify({'heatmap': heatmap})
+
     @app.route('/api/study/insights')
     def get_study_insights():
         session_id = get_or_create_session()
@@ -562,8 +731,86 @@ def create_app():
         goals = StudyTimerService.get_study_goals(session_id)
         return jsonify({'goals': goals})
 
+    # CLI commands
+    badges_cli = AppGroup('badges', help='Badge maintenance commands.')
+
+    @badges_cli.command('refresh-counts')
+    def refresh_badge_counts():
+        """Recompute materialized badge earn counts (run on a schedule to repair drift)."""
+        counts = BadgeService.refresh_earn_counts()
+        click.echo(f"Refreshed earn counts for {len(counts)} badges")
+
+    @badges_cli.command('backfill')
+    @click.option('--chunk-size', default=500, show_default=True, help='Sessions evaluated per chunk.')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count, 1 runs inline).')
+    @click.option('--checkpoint', default='badge_backfill.checkpoint.json', show_default=True,
+                  help='File recording the last committed session.')
+    @click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and start from the beginning.')
+    def backfill_badges(chunk_size, workers, checkpoint, restart):
+        """Award badges to every existing session under the current badge definitions."""
+        from services.badge_backfill import BadgeBackfill
+
+        result = BadgeBackfill.run(checkpoint, chunk_size=chunk_size, workers=workers, restart=restart, report=click.echo)
+        click.echo(f"Backfill complete: {result['sessions']} sessions, {result['awarded']} badges awarded")
+
+    app.cli.add_command(badges_cli)
+
+    journal_cli = AppGroup('journal', help='Journal maintenance commands.')
+
+    @journal_cli.command('reencrypt')
+    @click.option('--batch-size', default=500, show_default=True, help='Entries re-encrypted per commit.')
+    def reencrypt_journal_entries(batch_size):
+        """Re-encrypt entries that still use per-entry keys with their session's data key."""
+        migrated, failed = JournalService.reencrypt_legacy_entries(batch_size=batch_size, report=click.echo)
+        click.echo(f"Re-encryption complete: {migrated} entries migrated, {failed} failed")
+
+    @journal_cli.command('reindex')
+    @click.option('--batch-size', default=500, show_default=True, help='Entries indexed per commit.')
+    def reindex_journal_entries(batch_size):
+        """Rebuild the blind search index for all journal entries."""
+        indexed, failed = JournalService.reindex_entries(batch_size=batch_size, report=click.echo)
+        click.echo(f"Reindex complete: {indexed} entries indexed, {failed} failed")
+
+    app.cli.add_command(journal_cli)
+
+    micro_plans_cli = AppGroup('micro-plans', help='Micro-plan maintenance commands.')
+
+    @micro_plans_cli.command('refresh-funnels')
+    def refresh_micro_plan_funnels():
+        """Recompute micro-plan drop-off funnels now instead of waiting for FUNNEL_REFRESH_INTERVAL."""
+        rows = MicroPlanService().refresh_funnels()
+        click.echo(f"Refreshed {rows} funnel days")
+
+    app.cli.add_command(micro_plans_cli)
+
+    storage_cli = AppGroup('storage', help='Storage maintenance commands.')
+
+    @storage_cli.command('recompress')
+    @click.option('--batch-size', default=500, show_default=True, help='Rows rewritten per commit.')
+    def recompress_text(batch_size):
+        """Compress conversation and journal text stored before compression was enabled."""
+        from services.storage_service import StorageService
+
+        before = StorageService.get_text_storage()
+        scanned, rewritten = StorageService.recompress_conversations(batch_size=batch_size, report=click.echo)
+        click.echo(f"Conversations: {scanned} scanned, {rewritten} compressed")
+        scanned, rewritten, failed = StorageService.recompress_journal_entries(batch_size=batch_size, report=click.echo)
+        click.echo(f"Journal entries: {scanned} scanned, {rewritten} compressed, {failed} failed")
+
+        after = StorageService.get_text_storage()
+        for table in before:
+            saved = before[table] - after[table]
+            click.echo(f"{table}: {before[table]} -> {after[table]} bytes "
+                       f"({saved / before[table] * 100 if before[table] else 0:.1f}% saved)")
+
+        for table, rate in StorageService.measure_read_throughput(batch_size=batch_size).items():
+            click.echo(f"{table}: read {rate:.1f} rows/s")
+
+    app.cli.add_command(storage_cli)
+
     return app
 
 if __name__ == '__main__':
+    os.environ.setdefault('FLASK_DEBUG', '1')
     app = create_app()
     app.run(debug=True)
@@ -3,8 +3,10 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+DEFAULT_SECRET_KEY = 'supersecretkey'  # Development only; create_app refuses to derive journal keys from it
+
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY', 'supersecretkey')
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
     SESSION_TYPE = 'filesystem'
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
@@ -12,6 +14,15 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(os.path.dirname(__file__), "mental_wellness.db")}')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+    EVENT_STREAM_TIMEOUT = int(os.environ.get('EVENT_STREAM_TIMEOUT', 25))  # Seconds before the client reconnects
+    EVENT_STREAM_HEARTBEAT = int(os.environ.get('EVENT_STREAM_HEARTBEAT', 10))  # Seconds between keep-alives
+    EVENT_STREAM_MAX_CLIENTS = int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 48))  # Open streams per worker; keep below the thread count
+    NOTIFICATION_CHECK_INTERVAL = int(os.environ.get('NOTIFICATION_CHECK_INTERVAL', 60))  # Seconds between due-notification passes
+    FUNNEL_REFRESH_INTERVAL = int(os.environ.get('FUNNEL_REFRESH_INTERVAL', 900))  # Seconds before the gatekeeper view rebuilds micro-plan funnels
+    BADGE_EVALUATION_MODE = os.environ.get('BADGE_EVALUATION_MODE', 'async')  # 'async' (background worker) or 'sync'
+    JOURNAL_MASTER_KEY = os.environ.get('JOURNAL_MASTER_KEY', '')  # Fernet key wrapping journal data keys; derived from SECRET_KEY if empty
+    JOURNAL_INDEX_KEY = os.environ.get('JOURNAL_INDEX_KEY', '')  # HMAC key for blind search tokens; derived from the master key if empty
+    JOURNAL_KEY_CACHE_SIZE = int(os.environ.get('JOURNAL_KEY_CACHE_SIZE', 1024))  # Unwrapped data keys kept per worker
     LANGUAGES = ['en', 'hi', 'bn', 'ta', 'te', 'mr']
     CRISIS_KEYWORDS = [
         # English keywords
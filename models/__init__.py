@@ -6,9 +6,20 @@ from .user_session import UserSession
 from .conversation import Conversation
 from .crisis_detection import CrisisLog
 from .micro_plan_progress import MicroPlanProgress
+from .micro_plan_task_completion import MicroPlanTaskCompletion
+from .micro_plan_funnel import MicroPlanFunnel
 from .journal_entry import JournalEntry
 from .badge import Badge
 from .user_badge import UserBadge
 from .study_session import StudySession
+from .activity_counter import ActivityCounter
+from .activity_days import ActivityDays
+from .cache_version import CacheVersion
+from .badge_earn_count import BadgeEarnCount
+from .journal_key import JournalKey
+from .journal_search_token import JournalSearchToken
+from .journal_entry_tag import JournalEntryTag
+from .active_study_timer import ActiveStudyTimer
+from .study_pause import StudyPause
 
-__all__ = ['db', 'UserSession', 'Conversation', 'CrisisLog', 'MicroPlanProgress', 'JournalEntry', 'Badge', 'UserBadge', 'StudySession']
+__all__ = ['db', 'UserSession', 'Conversation', 'CrisisLog', 'MicroPlanProgress', 'MicroPlanTaskCompletion', 'MicroPlanFunnel', 'JournalEntry', 'Badge', 'UserBadge', 'StudySession', 'ActivityCounter', 'ActivityDays', 'CacheVersion', 'BadgeEarnCount', 'JournalKey', 'JournalSearchToken', 'JournalEntryTag', 'ActiveStudyTimer', 'StudyPause']
@@ -0,0 +1,82 @@
+from collections import namedtuple
+from datetime import datetime
+from models import db
+
+TIMER_RUNNING = 'running'
+TIMER_PAUSED = 'paused'
+
+# States each timer action may be taken from; anything else is rejected
+TIMER_TRANSITIONS = {
+    'pause': (TIMER_RUNNING,),
+    'resume': (TIMER_PAUSED,),
+    'stop': (TIMER_RUNNING, TIMER_PAUSED)
+}
+
+class TimerSnapshot(namedtuple('TimerSnapshot', [
+        'study_session_id', 'subject', 'mood_before', 'state', 'started_at', 'paused_at', 'paused_seconds'])):
+    """Detached, read-only copy of an active timer, kept in memory to answer status polls."""
+    __slots__ = ()
+
+    def elapsed_seconds(self, now=None):
+        """Seconds studied so far, not counting pauses."""
+        until = self.paused_at if self.state == TIMER_PAUSED else (now or datetime.utcnow())
+        return max(0, int((until - self.started_at).total_seconds()) - self.paused_seconds)
+
+class ActiveStudyTimer(db.Model):
+    """The study session a user is timing right now. The primary key allows one per user."""
+    __tablename__ = 'active_study_timers'
+
+    session_id = db.Column(db.String(36), primary_key=True)
+    study_session_id = db.Column(db.Integer, db.ForeignKey('study_sessions.id'), nullable=False, unique=True)
+    state = db.Column(db.String(10), nullable=False, default=TIMER_RUNNING)
+    started_at = db.Column(db.DateTime, nullable=False)
+    paused_at = db.Column(db.DateTime, nullable=True)  # Start of the ongoing pause
+    paused_seconds = db.Column(db.Integer, nullable=False, default=0)  # Total of finished pauses
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def can(self, action):
+        """Whether the timer's current state allows an action."""
+        return self.state in TIMER_TRANSITIONS[action]
+
+    def pause(self, now):
+        """Move a running timer to paused and record the pause. Runs in the caller's transaction."""
+        from models.study_pause import StudyPause
+
+        self.state = TIMER_PAUSED
+        self.paused_at = now
+        db.session.add(StudyPause(study_session_id=self.study_session_id, paused_at=now))
+
+    def resume(self, now):
+        """Move a paused timer back to running and close its pause. Runs in the caller's transaction."""
+        from models.study_pause import StudyPause
+
+        StudyPause.close_open(self.study_session_id, now)
+        self.paused_seconds += int((now - self.paused_at).total_seconds())
+        self.state = TIMER_RUNNING
+        self.paused_at = None
+
+    def finish(self, now):
+        """Close any ongoing pause and remove the timer. Returns (studied_seconds, paused_seconds)."""
+        if self.state == TIMER_PAUSED:
+            self.resume(now)
+
+        studied = max(0, int((now - self.started_at).total_seconds()) - self.paused_seconds)
+        paused = self.paused_seconds
+        db.session.delete(self)
+        return studied, paused
+
+    @staticmethod
+    def get_snapshot(session_id):
+        """Load a session's active timer as a TimerSnapshot, or None if it has none."""
+        from models import StudySession
+
+        row = db.session.query(ActiveStudyTimer, StudySession.subject, StudySession.mood_before)\
+            .join(StudySession, StudySession.id == ActiveStudyTimer.study_session_id)\
+            .filter(ActiveStudyTimer.session_id == session_id)\
+            .first()
+        if row is None:
+            return None
+
+        timer, subject, mood_before = row
+        return TimerSnapshot(timer.study_session_id, subject, mood_before, timer.state,
+                             timer.started_at, timer.paused_at, timer.paused_seconds)
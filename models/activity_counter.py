@@ -0,0 +1,100 @@
+from datetime import datetime
+from models import db
+import json
+
+# Activities tracked per session; 'mood_improvement' counts journal entries whose mood went up
+TRACKED_ACTIVITIES = ('mood', 'journal', 'chat', 'study', 'wellness', 'mood_improvement')
+
+class ActivityCounter(db.Model):
+    __tablename__ = 'activity_counters'
+    __table_args__ = (db.UniqueConstraint('session_id', 'activity', name='uq_activity_counters_session_activity'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), nullable=False, index=True)
+    activity = db.Column(db.String(50), nullable=False)  # One of TRACKED_ACTIVITIES
+    count = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)  # Summed amount, e.g. study seconds
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, session_id, activity):
+        self.session_id = session_id
+        self.activity = activity
+        self.count = 0
+        self.total = 0
+
+    def record(self, amount=0):
+        """Count one occurrence of the activity. Day streaks live in ActivityDays."""
+        self.count += 1
+        self.total += amount or 0
+
+    def unrecord(self, amount=0):
+        """Take back one occurrence of the activity, e.g. after its entry was deleted."""
+        self.count = max(0, self.count - 1)
+        self.total = max(0, self.total - (amount or 0))
+
+    @staticmethod
+    def get_session_counters(session_id):
+        """Get all counters for a session keyed by activity."""
+        counters = ActivityCounter.query.filter_by(session_id=session_id).all()
+        return {counter.activity: counter for counter in counters}
+
+    @staticmethod
+    def compute_session_counters(session_id):
+        """Compute every counter for a session from the source tables without saving them.
+
+        Counts and totals come from one aggregate query, so the cost does not depend
+        on the number of badges being evaluated.
+        """
+        from models import UserSession, JournalEntry, Conversation, StudySession, MicroPlanProgress
+
+        def count_of(column, *criteria):
+            return db.select(db.func.count(column)).where(*criteria).scalar_subquery()
+
+        improved = (JournalEntry.session_id == session_id, JournalEntry.mood_after > JournalEntry.mood_before)
+        completed_study = (StudySession.session_id == session_id, StudySession.completed.is_(True))
+        completed_plans = (MicroPlanProgress.session_id == session_id, MicroPlanProgress.is_completed.is_(True))
+
+        totals = db.session.query(
+            count_of(JournalEntry.id, JournalEntry.session_id == session_id).label('journal'),
+            count_of(Conversation.id, Conversation.session_id == session_id).label('chat'),
+            count_of(StudySession.id, *completed_study).label('study'),
+            count_of(MicroPlanProgress.id, *completed_plans).label('wellness'),
+            count_of(JournalEntry.id, *improved).label('mood_improvement'),
+            db.select(db.func.coalesce(db.func.sum(StudySession.duration), 0))
+                .where(*completed_study).scalar_subquery().label('study_seconds')
+        ).one()
+
+        mood_history = db.session.query(UserSession.mood_history).filter_by(session_id=session_id).scalar()
+
+        counts = dict(totals._mapping)
+        counts['mood'] = len(json.loads(mood_history or '[]'))
+
+        counters = {}
+        for activity in TRACKED_ACTIVITIES:
+            counter = ActivityCounter(session_id, activity)
+            counter.count = counts[activity]
+            counter.total = totals.study_seconds if activity == 'study' else 0
+            counters[activity] = counter
+
+        return counters
+
+    @staticmethod
+    def clear_session(session_id):
+        """Delete a session's counters so they are rebuilt on next use. Runs in the caller's transaction."""
+        ActivityCounter.query.filter_by(session_id=session_id).delete()
+
+    @staticmethod
+    def rebuild_session(session_id):
+        """Recompute and save every counter for a session from the source tables.
+
+        Used the first time a session is seen by the badge engine and as a repair path
+        when counters have drifted (e.g. after entries were deleted).
+        """
+        counters = ActivityCounter.compute_session_counters(session_id)
+
+        ActivityCounter.clear_session(session_id)
+        for counter in counters.values():
+            db.session.add(counter)
+
+        db.session.commit()
+        return counters
@@ -0,0 +1,183 @@
+from datetime import datetime, date
+from models import db
+import json
+
+# Activities with a day bitmap; the "any activity" streak is the union of all of them
+STREAK_ACTIVITIES = ('mood', 'journal', 'chat', 'study', 'wellness')
+
+class ActivityDays(db.Model):
+    """Per-session, per-activity bitmap of active days over the whole history.
+
+    Bit i of `bits` (little-endian) is set when the activity happened on the day
+    `start_day + i`, where `start_day` is a proleptic Gregorian ordinal.
+    """
+    __tablename__ = 'activity_days'
+    __table_args__ = (db.UniqueConstraint('session_id', 'activity', name='uq_activity_days_session_activity'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), nullable=False, index=True)
+    activity = db.Column(db.String(50), nullable=False)  # One of STREAK_ACTIVITIES
+    start_day = db.Column(db.Integer, nullable=True)  # date.toordinal() of bit 0
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, session_id, activity):
+        self.session_id = session_id
+        self.activity = activity
+        self.start_day = None
+        self.bits = b''
+
+    @property
+    def mask(self):
+        return int.from_bytes(self.bits or b'', 'little')
+
+    def _set_mask(self, mask):
+        self.bits = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+    def mark(self, day):
+        """Set the bit for a day, growing the bitmap backwards if needed."""
+        ordinal = day.toordinal()
+        mask = self.mask
+        if self.start_day is None:
+            self.start_day = ordinal
+        elif ordinal < self.start_day:
+            mask <<= self.start_day - ordinal
+            self.start_day = ordinal
+
+        self._set_mask(mask | (1 << (ordinal - self.start_day)))
+
+    def aligned_mask(self, base_day):
+        """Bitmap re-based so bit 0 is `base_day` (which must not be after start_day)."""
+        if self.start_day is None:
+            return 0
+        return self.mask << (self.start_day - base_day)
+
+    @staticmethod
+    def current_streak(mask, base_day, today=None):
+        """Consecutive active days ending today, or yesterday if today has no activity yet."""
+        today = (today or datetime.utcnow().date()).toordinal()
+        position = today - base_day
+        if position < 0:
+            return 0
+        if not (mask >> position) & 1:
+            position -= 1
+            if position < 0 or not (mask >> position) & 1:
+                return 0
+
+        gaps = ~mask & ((1 << (position + 1)) - 1)
+        return position + 1 if not gaps else position - (gaps.bit_length() - 1)
+
+    @staticmethod
+    def longest_streak(mask):
+        """Length of the longest run of set bits."""
+        length = 0
+        while mask:
+            mask &= mask >> 1
+            length += 1
+        return length
+
+    @staticmethod
+    def get_session_days(session_id):
+        """Get all bitmaps for a session keyed by activity, building them on first use."""
+        rows = ActivityDays.query.filter_by(session_id=session_id).all()
+        if not rows:
+            return ActivityDays.rebuild_session(session_id)
+        return {row.activity: row for row in rows}
+
+    @staticmethod
+    def record(session_id, activity, when=None):
+        """Mark today (or `when`) as active for an activity. Runs in the caller's transaction."""
+        days = ActivityDays.query.filter_by(session_id=session_id).all()
+        if not days:
+            # Build from history; the rebuild already includes the activity being recorded
+            ActivityDays.rebuild_session(session_id, commit=False)
+            return
+
+        row = next((row for row in days if row.activity == activity), None)
+        if row is None:
+            row = ActivityDays(session_id, activity)
+            db.session.add(row)
+        row.mark((when or datetime.utcnow()).date())
+
+    @staticmethod
+    def get_streaks(session_id, today=None):
+        """Current and longest streak per activity, plus the same for any activity."""
+        days = ActivityDays.get_session_days(session_id)
+        return ActivityDays.streaks_from_days(days, today)
+
+    @staticmethod
+    def streaks_from_days(days, today=None):
+        """Compute streaks from already-loaded bitmaps."""
+        streaks = {}
+        starts = [row.start_day for row in days.values() if row.start_day is not None]
+        base_day = min(starts) if starts else 0
+        any_mask = 0
+
+        for activity in STREAK_ACTIVITIES:
+            row = days.get(activity)
+            mask = row.aligned_mask(base_day) if row else 0
+            any_mask |= mask
+            streaks[activity] = {
+                'current': ActivityDays.current_streak(mask, base_day, today),
+                'longest': ActivityDays.longest_streak(mask)
+            }
+
+        streaks['any'] = {
+            'current': ActivityDays.current_streak(any_mask, base_day, today),
+            'longest': ActivityDays.longest_streak(any_mask)
+        }
+        return streaks
+
+    @staticmethod
+    def get_current_streak(session_id, activity, today=None):
+        """Current streak for one activity, read from a single bitmap row."""
+        row = ActivityDays.query.filter_by(session_id=session_id, activity=activity).first()
+        if row is None:
+            row = ActivityDays.get_session_days(session_id).get(activity)
+        if row is None or row.start_day is None:
+            return 0
+        return ActivityDays.current_streak(row.mask, row.start_day, today)
+
+    @staticmethod
+    def compute_session_days(session_id):
+        """Compute every bitmap for a session from the distinct active days in the source tables without saving them."""
+        from models import UserSession, JournalEntry, Conversation, StudySession, MicroPlanProgress
+
+        def active_days(activity, column, *criteria):
+            day = db.func.date(column)
+            return db.select(db.literal(activity).label('activity'), day.label('day'))\
+                .where(*criteria)\
+                .group_by(day)
+
+        day_rows = db.session.execute(db.union_all(
+            active_days('journal', JournalEntry.created_at, JournalEntry.session_id == session_id),
+            active_days('chat', Conversation.timestamp, Conversation.session_id == session_id),
+            active_days('study', StudySession.start_time, StudySession.session_id == session_id,
+                        StudySession.completed.is_(True)),
+            active_days('wellness', MicroPlanProgress.completion_date, MicroPlanProgress.session_id == session_id,
+                        MicroPlanProgress.is_completed.is_(True))
+        )).all()
+
+        mood_history = db.session.query(UserSession.mood_history).filter_by(session_id=session_id).scalar()
+
+        days = {activity: ActivityDays(session_id, activity) for activity in STREAK_ACTIVITIES}
+        for entry in json.loads(mood_history or '[]'):
+            days['mood'].mark(datetime.fromisoformat(entry['date']).date())
+        for activity, day in day_rows:
+            if day is not None:
+                days[activity].mark(date.fromisoformat(str(day)))
+
+        return days
+
+    @staticmethod
+    def rebuild_session(session_id, commit=True):
+        """Recompute and save every bitmap for a session from its full history."""
+        days = ActivityDays.compute_session_days(session_id)
+
+        ActivityDays.query.filter_by(session_id=session_id).delete()
+        for row in days.values():
+            db.session.add(row)
+
+        if commit:
+            db.session.commit()
+        return days
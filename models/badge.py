@@ -1,6 +1,43 @@
+from collections import namedtuple
 from datetime import datetime
+from types import MappingProxyType
 from models import db
 import json
+import time
+
+class BadgeDefinition(namedtuple('BadgeDefinition', [
+        'id', 'name', 'description', 'icon', 'color', 'category',
+        'criteria_type', 'criteria_value', 'is_active', 'created_at'])):
+    """Detached, read-only copy of a Badge row used for in-memory badge evaluation."""
+    __slots__ = ()
+
+    @classmethod
+    def from_badge(cls, badge):
+        return cls(badge.id, badge.name, badge.description, badge.icon, badge.color, badge.category,
+                   badge.criteria_type, badge.criteria_value, badge.is_active, badge.created_at)
+
+    def to_dict(self):
+        data = self._asdict()
+        data['created_at'] = self.created_at.isoformat() if self.created_at else None
+        return data
+
+class BadgeCatalog:
+    """Immutable snapshot of the badge table, indexed by id, category and criteria type."""
+    __slots__ = ('version', 'badges', 'by_id', 'by_category', 'by_criteria_type')
+
+    def __init__(self, version, definitions):
+        by_category = {}
+        by_criteria_type = {}
+        active = tuple(badge for badge in definitions if badge.is_active)
+        for badge in active:
+            by_category.setdefault(badge.category, []).append(badge)
+            by_criteria_type.setdefault(badge.criteria_type, []).append(badge)
+
+        self.version = version
+        self.badges = active  # Active badges only
+        self.by_id = MappingProxyType({badge.id: badge for badge in definitions})  # Includes inactive badges
+        self.by_category = MappingProxyType({key: tuple(value) for key, value in by_category.items()})
+        self.by_criteria_type = MappingProxyType({key: tuple(value) for key, value in by_criteria_type.items()})
 
 class Badge(db.Model):
     __tablename__ = 'badges'
@@ -19,6 +56,12 @@ class Badge(db.Model):
     # Relationship
     user_badges = db.relationship('UserBadge', backref='badge', lazy=True)
 
+    # Process-wide catalog, re-checked against the shared cache version every few seconds
+    CATALOG_CACHE_NAME = 'badge_catalog'
+    CATALOG_CHECK_INTERVAL = 5  # Seconds
+    _catalog = None
+    _catalog_checked_at = 0.0
+
     def __init__(self, name, description, category, criteria_type, criteria_value, icon=None, color='primary'):
         self.name = name
         self.description = description
@@ -47,6 +90,32 @@ class Badge(db.Model):
         """Get all active badges."""
         return Badge.query.filter_by(is_active=True).all()
 
+    @classmethod
+    def get_catalog(cls):
+        """Get the cached badge catalog, reloading it when another worker has changed the badges."""
+        catalog = cls._catalog
+        now = time.monotonic()
+        if catalog is not None and now - cls._catalog_checked_at < cls.CATALOG_CHECK_INTERVAL:
+            return catalog
+
+        from models import CacheVersion
+
+        version = CacheVersion.get_version(cls.CATALOG_CACHE_NAME)
+        if catalog is None or catalog.version != version:
+            catalog = BadgeCatalog(version, [BadgeDefinition.from_badge(badge) for badge in Badge.query.all()])
+            cls._catalog = catalog
+
+        cls._catalog_checked_at = now
+        return catalog
+
+    @classmethod
+    def invalidate_catalog(cls):
+        """Mark the catalog stale in every worker after the badge table changes."""
+        from models import CacheVersion
+
+        CacheVersion.bump(cls.CATALOG_CACHE_NAME)
+        cls._catalog = None
+
     @staticmethod
     def get_badges_by_category(category):
         """Get badges by category."""
@@ -96,4 +165,5 @@ class Badge(db.Model):
                 db.session.add(badge)
 
         db.session.commit()
+        Badge.invalidate_catalog()
         return default_badges
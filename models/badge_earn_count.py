@@ -0,0 +1,46 @@
+from datetime import datetime
+from models import db
+
+class BadgeEarnCount(db.Model):
+    """Materialized number of users holding each badge, maintained on award."""
+    __tablename__ = 'badge_earn_counts'
+
+    badge_id = db.Column(db.Integer, db.ForeignKey('badges.id'), primary_key=True)
+    earned_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def increment(badge_ids):
+        """Add awards to the counts. Runs in the caller's transaction."""
+        increments = {}
+        for badge_id in badge_ids:
+            increments[badge_id] = increments.get(badge_id, 0) + 1
+
+        for badge_id, amount in increments.items():
+            updated = BadgeEarnCount.query.filter_by(badge_id=badge_id)\
+                .update({'earned_count': BadgeEarnCount.earned_count + amount, 'updated_at': datetime.utcnow()},
+                        synchronize_session=False)
+            if not updated:
+                db.session.add(BadgeEarnCount(badge_id=badge_id, earned_count=amount))
+
+    @staticmethod
+    def get_counts():
+        """Get earn counts keyed by badge id."""
+        return dict(db.session.query(BadgeEarnCount.badge_id, BadgeEarnCount.earned_count).all())
+
+    @staticmethod
+    def refresh():
+        """Recompute every count from user_badges with a single GROUP BY."""
+        from models import UserBadge
+
+        counts = dict(db.session.query(UserBadge.badge_id, db.func.count(UserBadge.id))
+                      .filter(UserBadge.is_earned.is_(True))
+                      .group_by(UserBadge.badge_id)
+                      .all())
+
+        BadgeEarnCount.query.delete()
+        for badge_id, earned_count in counts.items():
+            db.session.add(BadgeEarnCount(badge_id=badge_id, earned_count=earned_count))
+
+        db.session.commit()
+        return counts
@@ -0,0 +1,63 @@
+from datetime import datetime
+from models import db
+
+class CacheVersion(db.Model):
+    """Version counters for process-local caches.
+
+    Each gunicorn worker keeps its own in-memory copies; bumping a version here is how
+    an edit made in one worker tells the others that their copy is stale.
+    """
+    __tablename__ = 'cache_versions'
+    __table_args__ = (db.Index('ix_cache_versions_updated_at', 'updated_at'),)
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def get_version(name):
+        """Get the current version of a cache."""
+        return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+    @staticmethod
+    def increment(name):
+        """Increment a cache version in the caller's transaction, creating it on first use.
+
+        An upsert on SQLite and PostgreSQL, so two first increments of a name don't collide.
+        """
+        now = datetime.utcnow()
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            from sqlalchemy.dialects import postgresql, sqlite
+
+            insert = (sqlite if dialect == 'sqlite' else postgresql).insert(CacheVersion)
+            db.session.execute(insert.values(name=name, version=1, updated_at=now).on_conflict_do_update(
+                index_elements=['name'], set_={'version': CacheVersion.version + 1, 'updated_at': now}))
+            return
+
+        entry = db.session.get(CacheVersion, name)
+        if not entry:
+            entry = CacheVersion(name=name, version=0)
+            db.session.add(entry)
+        entry.version += 1
+        entry.updated_at = now
+
+    @staticmethod
+    def bump(name):
+        """Increment a cache version and commit it."""
+        CacheVersion.increment(name)
+        db.session.commit()
+
+    @staticmethod
+    def prune(prefix, before):
+        """Delete the versions starting with `prefix` last bumped before `before`. Runs in the caller's transaction."""
+        return CacheVersion.query.filter(CacheVersion.name.startswith(prefix))\
+            .filter(CacheVersion.updated_at < before)\
+            .delete(synchronize_session=False)
+
+    @staticmethod
+    def get_changed_since(prefix, since):
+        """Get the names starting with `prefix` whose version was bumped after `since`."""
+        return [name for (name,) in db.session.query(CacheVersion.name)
+                .filter(CacheVersion.updated_at > since)
+                .filter(CacheVersion.name.startswith(prefix))]
@@ -0,0 +1,44 @@
+import zlib
+from sqlalchemy.types import TypeDecorator, Text
+
+# Prefix marking zlib-compressed payloads. Text never starts with a NUL byte, so
+# anything without it is a legacy plain value and is read back unchanged.
+COMPRESSED_MARKER = b'\x00z1'
+MIN_COMPRESS_BYTES = 256  # Shorter values rarely shrink enough to pay for the header
+
+def pack_text(text):
+    """Encode text to bytes, compressing it when that makes it smaller."""
+    raw = text.encode()
+    if len(raw) >= MIN_COMPRESS_BYTES:
+        packed = COMPRESSED_MARKER + zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed
+    return raw
+
+def unpack_text(data):
+    """Decode bytes produced by pack_text, or plain UTF-8 from before compression existed."""
+    if data.startswith(COMPRESSED_MARKER):
+        return zlib.decompress(data[len(COMPRESSED_MARKER):]).decode()
+    return data.decode()
+
+class CompressedText(TypeDecorator):
+    """Text column stored compressed on SQLite when that saves space.
+
+    Compressed values are written as BLOBs into the existing TEXT column (SQLite keeps
+    the storage class per value), so rows written before compression still read back
+    as plain strings and no schema change is needed. Other databases reject bytes in a
+    TEXT column, so there values are stored as plain text.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        packed = pack_text(value)
+        return packed if packed.startswith(COMPRESSED_MARKER) else value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return unpack_text(value)
+        return value
@@ -1,16 +1,36 @@
 from . import db
+from .compression import CompressedText
 from datetime import datetime
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (db.Index('ix_conversations_session_timestamp', 'session_id', 'timestamp', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(255), db.ForeignKey('user_sessions.session_id'), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    response = db.Column(db.Text, nullable=False)
+    message = db.Column(CompressedText, nullable=False)
+    response = db.Column(CompressedText, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     language = db.Column(db.String(10), default='en')
     crisis_detected = db.Column(db.Boolean, default=False)
 
     def __repr__(self):
         return f'<Conversation {self.id} for session {self.session_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'message': self.message,
+            'response': self.response,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'language': self.language,
+            'crisis_detected': self.crisis_detected
+        }
+
+    @staticmethod
+    def get_history_page(session_id, limit=20, cursor=None, offset=0):
+        """Get a newest-first page of a user's conversation history and the cursor for the next page."""
+        from models.pagination import keyset_page
+
+        return keyset_page(Conversation.query.filter_by(session_id=session_id),
+                           Conversation.timestamp, Conversation.id, limit, cursor, offset)
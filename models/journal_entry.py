@@ -1,12 +1,19 @@
 from datetime import datetime
 from models import db
+from models.compression import pack_text, unpack_text
 import json
 from cryptography.fernet import Fernet
+from concurrent.futures import ThreadPoolExecutor
 import base64
 import os
 
+DECRYPTABLE_FIELDS = ('title', 'content')
+PARALLEL_DECRYPT_MIN = 200  # Pages at least this large spread decryption over a thread pool
+DECRYPT_WORKERS = min(4, os.cpu_count() or 1)
+
 class JournalEntry(db.Model):
     __tablename__ = 'journal_entries'
+    __table_args__ = (db.Index('ix_journal_entries_session_created', 'session_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), nullable=False, index=True)
@@ -16,7 +23,7 @@ class JournalEntry(db.Model):
     mood_after = db.Column(db.Integer, nullable=True)  # 1-10 scale
     tags = db.Column(db.Text, nullable=True)  # JSON array of tags
     is_encrypted = db.Column(db.Boolean, default=True)
-    encryption_key = db.Column(db.Text, nullable=True)  # Base64 encoded key
+    encryption_key = db.Column(db.Text, nullable=True)  # Session key marker, or a legacy base64 encoded per-entry key
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -34,51 +41,117 @@ class JournalEntry(db.Model):
         else:
             self.encryption_key = None
 
-    def _generate_key(self):
-        """Generate a new encryption key."""
-        return Fernet.generate_key()
-
     def _encrypt_content(self):
-        """Encrypt the content and title if they exist."""
-        key = self._generate_key()
-        fernet = Fernet(key)
+        """Compress, then encrypt the content and title with the session's data key."""
+        from services.journal_crypto import JournalCrypto, SESSION_KEY_MARKER
 
+        fernet = JournalCrypto.get_fernet(self.session_id, create=True)
         if self.content:
-            self.content = fernet.encrypt(self.content.encode()).decode()
+            self.content = fernet.encrypt(pack_text(self.content)).decode()
         if self.title:
-            self.title = fernet.encrypt(self.title.encode()).decode()
+            self.title = fernet.encrypt(pack_text(self.title)).decode()
 
-        self.encryption_key = base64.b64encode(key).decode()
+        self.encryption_key = SESSION_KEY_MARKER
+
+    def _get_fernet(self):
+        """Get the Fernet this entry was encrypted with."""
+        from services.journal_crypto import JournalCrypto, SESSION_KEY_MARKER
+
+        if self.encryption_key == SESSION_KEY_MARKER:
+            return JournalCrypto.get_fernet(self.session_id)
+        # Entries written before envelope encryption carry their own base64 encoded key
+        return Fernet(base64.b64decode(self.encryption_key))
+
+    def uses_legacy_key(self):
+        """Whether the entry is still encrypted with a per-entry key."""
+        from services.journal_crypto import SESSION_KEY_MARKER
+
+        return bool(self.is_encrypted and self.encryption_key and self.encryption_key != SESSION_KEY_MARKER)
+
+    def decrypt_fields(self):
+        """Get the plaintext (title, content) of the entry."""
+        if not self.is_encrypted or not self.encryption_key:
+            return self.title, self.content
+
+        fernet = self._get_fernet()
+        content = unpack_text(fernet.decrypt(self.content.encode())) if self.content else ''
+        title = unpack_text(fernet.decrypt(self.title.encode())) if self.title else None
+        return title, content
+
+    def reencrypt(self):
+        """Re-encrypt the entry in place with the session's data key."""
+        self.title, self.content = self.decrypt_fields()
+        self._encrypt_content()
+
+    def needs_compression(self):
+        """Whether the entry holds encrypted text that was stored uncompressed but would shrink."""
+        from models.compression import COMPRESSED_MARKER
 
-    def decrypt_content(self):
-        """Decrypt the content and return a copy with decrypted data."""
         if not self.is_encrypted or not self.encryption_key:
-            return self
-
-        try:
-            key = base64.b64decode(self.encryption_key)
-            fernet = Fernet(key)
-
-            # Create a copy to avoid modifying the original
-            decrypted_entry = JournalEntry(
-                session_id=self.session_id,
-                content=fernet.decrypt(self.content.encode()).decode() if self.content else '',
-                title=fernet.decrypt(self.title.encode()).decode() if self.title else None,
-                mood_before=self.mood_before,
-                mood_after=self.mood_after,
-                tags=self.tags,
-                encrypt=False
-            )
-            decrypted_entry.id = self.id
-            decrypted_entry.created_at = self.created_at
-            decrypted_entry.updated_at = self.updated_at
-            decrypted_entry.is_encrypted = False
-            decrypted_entry.encryption_key = None
-
-            return decrypted_entry
-        except Exception as e:
-            print(f"Decryption failed: {e}")
-            return self
+            return False
+
+        fernet = self._get_fernet()
+        for value in (self.title, self.content):
+            if value:
+                raw = fernet.decrypt(value.encode())
+                if not raw.startswith(COMPRESSED_MARKER) and pack_text(raw.decode()).startswith(COMPRESSED_MARKER):
+                    return True
+        return False
+
+    def decrypt_content(self):
+        """Decrypt the entry into a read-only view, leaving the original untouched."""
+        return JournalEntry.decrypt_entries([self])[0]
+
+    _decrypt_pool = None
+
+    @staticmethod
+    def decrypt_entries(entries, fields=DECRYPTABLE_FIELDS):
+        """Decrypt entries into lightweight views, decrypting only the requested fields.
+
+        Keys are resolved once per session up front, since key lookups need the app
+        context; large pages then run the Fernet work on a thread pool.
+        """
+        fernets = {}
+        for entry in entries:
+            key_ref = (entry.session_id, entry.encryption_key)
+            if entry.is_encrypted and entry.encryption_key and key_ref not in fernets:
+                try:
+                    fernets[key_ref] = entry._get_fernet()
+                except Exception as e:
+                    print(f"Decryption failed: {e}")
+                    fernets[key_ref] = None
+
+        def decrypt(entry):
+            if not entry.is_encrypted or not entry.encryption_key:
+                return JournalEntryView(entry, entry.title, entry.content)
+
+            fernet = fernets[(entry.session_id, entry.encryption_key)]
+            if fernet is None:
+                return entry
+
+            try:
+                title = content = None
+                if 'title' in fields and entry.title:
+                    title = unpack_text(fernet.decrypt(entry.title.encode()))
+                if 'content' in fields:
+                    content = unpack_text(fernet.decrypt(entry.content.encode())) if entry.content else ''
+                return JournalEntryView(entry, title, content)
+            except Exception as e:
+                print(f"Decryption failed: {e}")
+                return entry
+
+        def decrypt_slice(batch):
+            return [decrypt(entry) for entry in batch]
+
+        if len(entries) < PARALLEL_DECRYPT_MIN or DECRYPT_WORKERS < 2:
+            return decrypt_slice(entries)
+
+        if JournalEntry._decrypt_pool is None:
+            JournalEntry._decrypt_pool = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix='journal-decrypt')
+
+        size = -(-len(entries) // DECRYPT_WORKERS)
+        slices = [entries[i:i + size] for i in range(0, len(entries), size)]
+        return [view for batch in JournalEntry._decrypt_pool.map(decrypt_slice, slices) for view in batch]
 
     def get_tags_list(self):
         """Get tags as a list."""
@@ -94,7 +167,7 @@ class JournalEntry(db.Model):
         self.tags = json.dumps(tags_list) if tags_list else None
 
     @staticmethod
-    def get_user_entries(session_id, limit=50, offset=0, decrypt=True):
+    def get_user_entries(session_id, limit=50, offset=0, decrypt=True, fields=DECRYPTABLE_FIELDS):
         """Get journal entries for a user."""
         entries = JournalEntry.query.filter_by(session_id=session_id)\
             .order_by(JournalEntry.created_at.desc())\
@@ -103,9 +176,20 @@ class JournalEntry(db.Model):
             .all()
 
         if decrypt:
-            return [entry.decrypt_content() for entry in entries]
+            return JournalEntry.decrypt_entries(entries, fields)
         return entries
 
+    @staticmethod
+    def get_user_entries_page(session_id, limit=20, cursor=None, offset=0, decrypt=True, fields=DECRYPTABLE_FIELDS):
+        """Get a newest-first page of a user's entries and the cursor for the next page."""
+        from models.pagination import keyset_page
+
+        entries, next_cursor = keyset_page(JournalEntry.query.filter_by(session_id=session_id),
+                                           JournalEntry.created_at, JournalEntry.id, limit, cursor, offset)
+        if decrypt:
+            entries = JournalEntry.decrypt_entries(entries, fields)
+        return entries, next_cursor
+
     @staticmethod
     def get_entries_by_date_range(session_id, start_date, end_date, decrypt=True):
         """Get entries within a date range."""
@@ -116,19 +200,22 @@ class JournalEntry(db.Model):
             .all()
 
         if decrypt:
-            return [entry.decrypt_content() for entry in entries]
+            return JournalEntry.decrypt_entries(entries)
         return entries
 
     @staticmethod
     def get_entries_by_tag(session_id, tag, decrypt=True):
         """Get entries containing a specific tag."""
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.tags.contains(f'"{tag}"'))\
+        from models import JournalEntryTag
+
+        entries = JournalEntry.query\
+            .join(JournalEntryTag, JournalEntryTag.entry_id == JournalEntry.id)\
+            .filter(JournalEntryTag.session_id == session_id, JournalEntryTag.tag == tag)\
             .order_by(JournalEntry.created_at.desc())\
             .all()
 
         if decrypt:
-            return [entry.decrypt_content() for entry in entries]
+            return JournalEntry.decrypt_entries(entries)
         return entries
 
     @staticmethod
@@ -144,27 +231,62 @@ class JournalEntry(db.Model):
         entries = query.order_by(JournalEntry.created_at.desc()).all()
 
         if decrypt:
-            return [entry.decrypt_content() for entry in entries]
+            return JournalEntry.decrypt_entries(entries)
         return entries
 
     @staticmethod
-    def search_entries(session_id, query, decrypt=True):
-        """Search entries by content or title."""
-        # Note: This is a basic search. For encrypted entries, search would be limited
-        # In a real app, you might want to implement searchable encryption or search decrypted content
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(
-                db.or_(
-                    JournalEntry.title.contains(query),
-                    JournalEntry.content.contains(query)
-                )
-            )\
-            .order_by(JournalEntry.created_at.desc())\
-            .all()
-
-        if decrypt:
-            return [entry.decrypt_content() for entry in entries]
-        return entries
+    def search_entries(session_id, query, decrypt=True, limit=20, cursor=None):
+        """Search entries a page at a time.
+
+        Unencrypted entries come first, ranked by BM25 from the FTS5 index, followed by
+        encrypted entries ranked through the blind token index. The cursor is
+        "<phase>:<offset>" within that order. Returns a dict with the entries, HTML
+        snippets keyed by entry id (FTS matches only) and the next cursor, if any.
+        Raises ValueError for a malformed cursor.
+        """
+        from models import JournalSearchToken
+        from models.journal_fts import JournalFTS
+        from services.journal_crypto import JournalCrypto
+
+        phase, _, offset = (cursor or '').partition(':')
+        if cursor and (phase not in ('fts', 'blind') or not offset.isdigit()):
+            raise ValueError("Invalid search cursor")
+        if not cursor or (phase == 'fts' and not JournalFTS.available):
+            phase, offset = ('fts' if JournalFTS.available else 'blind'), 0
+        offset = int(offset)
+
+        hits = []
+        next_cursor = None
+        while True:
+            remaining = limit - len(hits)
+            if phase == 'fts':
+                found = [(entry_id, snippet) for entry_id, _, snippet in
+                         JournalFTS.search(session_id, query, remaining + 1, offset)]
+            else:
+                tokens = JournalCrypto.blind_tokens(session_id, query)
+                found = [(entry_id, None) for entry_id, _ in
+                         JournalSearchToken.search(session_id, tokens, remaining + 1, offset,
+                                                   encrypted_only=JournalFTS.available)]
+
+            if len(found) > remaining:
+                hits.extend(found[:remaining])
+                next_cursor = f'{phase}:{offset + remaining}'
+                break
+
+            hits.extend(found)
+            if phase == 'blind':
+                break
+            phase, offset = 'blind', 0
+
+        entries_by_id = {entry.id: entry for entry in JournalEntry.query
+                         .filter(JournalEntry.id.in_([entry_id for entry_id, _ in hits]))} if hits else {}
+        entries = [entries_by_id[entry_id] for entry_id, _ in hits if entry_id in entries_by_id]
+
+        return {
+            'entries': JournalEntry.decrypt_entries(entries) if decrypt else entries,
+            'snippets': {entry_id: snippet for entry_id, snippet in hits if snippet},
+            'next_cursor': next_cursor
+        }
 
     @staticmethod
     def get_mood_trends(session_id, days=30):
@@ -210,3 +332,28 @@ class JournalEntry(db.Model):
             data['content'] = '[ENCRYPTED - Click to decrypt]'
 
         return data
+
+
+class JournalEntryView:
+    """Read-only decrypted journal entry returned by the list and search endpoints.
+
+    Far cheaper to build than a transient JournalEntry copy: no ORM instrumentation,
+    no constructor side effects and no tag JSON round trip. Fields that were not
+    requested for decryption are None.
+    """
+    __slots__ = ('id', 'session_id', 'title', 'content', 'mood_before', 'mood_after', 'tags', 'created_at', 'updated_at')
+    is_encrypted = False
+
+    def __init__(self, entry, title, content):
+        self.id = entry.id
+        self.session_id = entry.session_id
+        self.title = title
+        self.content = content
+        self.mood_before = entry.mood_before
+        self.mood_after = entry.mood_after
+        self.tags = entry.tags
+        self.created_at = entry.created_at
+        self.updated_at = entry.updated_at
+
+    get_tags_list = JournalEntry.get_tags_list
+    to_dict = JournalEntry.to_dict
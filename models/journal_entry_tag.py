@@ -0,0 +1,63 @@
+from models import db
+import json
+
+class JournalEntryTag(db.Model):
+    """One row per tag on a journal entry, mirroring JournalEntry.tags for indexed lookups."""
+    __tablename__ = 'journal_entry_tags'
+    __table_args__ = (db.Index('ix_journal_entry_tags_session_tag', 'session_id', 'tag'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=False, index=True)
+    session_id = db.Column(db.String(36), nullable=False)
+    tag = db.Column(db.String(100), nullable=False)
+
+    @staticmethod
+    def set_entry_tags(entry_id, session_id, tags):
+        """Replace an entry's tags. Runs in the caller's transaction."""
+        JournalEntryTag.remove_entry(entry_id)
+        rows = [{'entry_id': entry_id, 'session_id': session_id, 'tag': tag} for tag in dict.fromkeys(tags or []) if tag]
+        if rows:
+            db.session.execute(db.insert(JournalEntryTag), rows)
+
+    @staticmethod
+    def remove_entry(entry_id):
+        """Remove an entry's tags. Runs in the caller's transaction."""
+        JournalEntryTag.query.filter_by(entry_id=entry_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def get_top_tags(session_id, since=None, limit=10):
+        """Get (tag, count) pairs for a session, most used first, with one GROUP BY."""
+        from models import JournalEntry
+
+        count = db.func.count(JournalEntryTag.id).label('count')
+        query = db.session.query(JournalEntryTag.tag, count).filter(JournalEntryTag.session_id == session_id)
+        if since is not None:
+            query = query.join(JournalEntry, JournalEntry.id == JournalEntryTag.entry_id)\
+                .filter(JournalEntry.created_at >= since)
+
+        query = query.group_by(JournalEntryTag.tag).order_by(count.desc(), JournalEntryTag.tag)
+        return query.limit(limit).all() if limit else query.all()
+
+    @staticmethod
+    def backfill():
+        """Fill the table from the JSON tags column if it has never been populated."""
+        from models import JournalEntry
+
+        if db.session.query(JournalEntryTag.id).first() is not None:
+            return 0
+
+        rows = []
+        for entry_id, session_id, tags in db.session.query(JournalEntry.id, JournalEntry.session_id, JournalEntry.tags)\
+                .filter(JournalEntry.tags.isnot(None)):
+            try:
+                tag_list = json.loads(tags) or []
+            except ValueError:
+                continue
+            if isinstance(tag_list, list):
+                rows.extend({'entry_id': entry_id, 'session_id': session_id, 'tag': tag}
+                            for tag in dict.fromkeys(tag_list) if isinstance(tag, str) and tag)
+
+        if rows:
+            db.session.execute(db.insert(JournalEntryTag), rows)
+        db.session.commit()
+        return len(rows)
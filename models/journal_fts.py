@@ -0,0 +1,104 @@
+from html import escape
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from models import db
+from models.journal_entry import JournalEntry
+
+# Private-use markers around matches in snippets, swapped for <mark> after HTML escaping
+_MATCH_START = '\ue000'
+_MATCH_END = '\ue001'
+
+class JournalFTS:
+    """SQLite FTS5 index over unencrypted journal entries.
+
+    The virtual table's rowid is the journal entry id and `owner` holds a per-session
+    token, so a search only walks the postings of the current user's entries. It is kept
+    in sync by mapper hooks on JournalEntry; encrypted entries are never written to it.
+    When the SQLite build has no FTS5 the index is disabled and search falls back to
+    the blind token index.
+    """
+    available = False
+
+    @staticmethod
+    def setup():
+        """Create the FTS table if needed, filling it from existing entries on first creation."""
+        if db.engine.dialect.name != 'sqlite':
+            JournalFTS.available = False
+            return
+
+        try:
+            with db.engine.begin() as connection:
+                exists = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_fts'"
+                )).first()
+                if not exists:
+                    connection.execute(text(
+                        "CREATE VIRTUAL TABLE journal_fts USING fts5("
+                        "title, content, owner, tokenize = 'unicode61 remove_diacritics 2')"
+                    ))
+                    connection.execute(text(
+                        "INSERT INTO journal_fts (rowid, title, content, owner) "
+                        "SELECT id, coalesce(title, ''), content, 's' || replace(session_id, '-', '') "
+                        "FROM journal_entries WHERE NOT is_encrypted"
+                    ))
+            JournalFTS.available = True
+        except OperationalError as e:
+            print(f"Journal full-text search disabled (FTS5 unavailable): {e}")
+            JournalFTS.available = False
+
+    @staticmethod
+    def owner_token(session_id):
+        return 's' + session_id.replace('-', '')
+
+    @staticmethod
+    def build_query(session_id, query):
+        """Turn free text into an FTS5 query matching any of its words within the session's entries."""
+        from services.journal_crypto import JournalCrypto
+
+        words = sorted(JournalCrypto.normalize_words(query))
+        if not words:
+            return None
+        terms = ' OR '.join(f'"{word}"' for word in words)
+        return f'owner : "{JournalFTS.owner_token(session_id)}" AND ({terms})'
+
+    @staticmethod
+    def search(session_id, query, limit=20, offset=0):
+        """Get (entry_id, score, snippet_html) ranked by BM25, best first; title matches weigh more."""
+        match = JournalFTS.build_query(session_id, query)
+        if match is None:
+            return []
+
+        rows = db.session.execute(text(
+            "SELECT rowid, bm25(journal_fts, 5.0, 1.0, 0.0) AS score, "
+            "snippet(journal_fts, 1, :start, :end, '…', 16) AS snippet "
+            "FROM journal_fts WHERE journal_fts MATCH :match "
+            "ORDER BY score LIMIT :limit OFFSET :offset"
+        ), {'start': _MATCH_START, 'end': _MATCH_END, 'match': match, 'limit': limit, 'offset': offset}).all()
+
+        return [(entry_id, score, JournalFTS._snippet_html(snippet)) for entry_id, score, snippet in rows]
+
+    @staticmethod
+    def _snippet_html(snippet):
+        return escape(snippet or '').replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+    @staticmethod
+    def _write(connection, entry):
+        connection.execute(text("DELETE FROM journal_fts WHERE rowid = :id"), {'id': entry.id})
+        if not entry.is_encrypted:
+            connection.execute(text(
+                "INSERT INTO journal_fts (rowid, title, content, owner) VALUES (:id, :title, :content, :owner)"
+            ), {'id': entry.id, 'title': entry.title or '', 'content': entry.content or '',
+                'owner': JournalFTS.owner_token(entry.session_id)})
+
+
+@event.listens_for(JournalEntry, 'after_insert')
+@event.listens_for(JournalEntry, 'after_update')
+def _sync_journal_fts(mapper, connection, entry):
+    if JournalFTS.available:
+        JournalFTS._write(connection, entry)
+
+
+@event.listens_for(JournalEntry, 'after_delete')
+def _remove_journal_fts(mapper, connection, entry):
+    if JournalFTS.available:
+        connection.execute(text("DELETE FROM journal_fts WHERE rowid = :id"), {'id': entry.id})
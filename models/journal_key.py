@@ -0,0 +1,34 @@
+from datetime import datetime
+from models import db
+
+class JournalKey(db.Model):
+    """A session's journal data key, stored wrapped (encrypted) with the master key."""
+    __tablename__ = 'journal_keys'
+
+    session_id = db.Column(db.String(255), primary_key=True)
+    wrapped_key = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def get_wrapped_key(session_id):
+        """Get a session's wrapped data key, or None if it has none yet."""
+        return db.session.query(JournalKey.wrapped_key).filter_by(session_id=session_id).scalar()
+
+    @staticmethod
+    def add_if_missing(session_id, wrapped_key):
+        """Store a wrapped key unless the session already has one, in the caller's transaction.
+
+        Returns the wrapped key that is stored, which is another request's when it got there
+        first. Uses INSERT ... ON CONFLICT DO NOTHING on SQLite and PostgreSQL.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            db.session.add(JournalKey(session_id=session_id, wrapped_key=wrapped_key))
+            return wrapped_key
+
+        from sqlalchemy.dialects import postgresql, sqlite
+
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(JournalKey)
+        db.session.execute(insert.values(session_id=session_id, wrapped_key=wrapped_key, created_at=datetime.utcnow())
+                           .on_conflict_do_nothing(index_elements=['session_id']))
+        return JournalKey.get_wrapped_key(session_id)
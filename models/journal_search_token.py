@@ -0,0 +1,50 @@
+from models import db
+
+class JournalSearchToken(db.Model):
+    """Blind index of journal entries: one keyed hash per distinct word of an entry.
+
+    Lets encrypted entries be searched with an indexed lookup instead of decrypting them.
+    """
+    __tablename__ = 'journal_search_tokens'
+    __table_args__ = (db.Index('ix_journal_search_tokens_session_token', 'session_id', 'token'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=False, index=True)
+    session_id = db.Column(db.String(36), nullable=False)
+    token = db.Column(db.String(32), nullable=False)
+
+    @staticmethod
+    def index_entry(entry_id, session_id, tokens):
+        """Replace an entry's tokens. Runs in the caller's transaction."""
+        JournalSearchToken.remove_entry(entry_id)
+        if tokens:
+            db.session.execute(db.insert(JournalSearchToken), [
+                {'entry_id': entry_id, 'session_id': session_id, 'token': token} for token in tokens
+            ])
+
+    @staticmethod
+    def remove_entry(entry_id):
+        """Remove an entry's tokens. Runs in the caller's transaction."""
+        JournalSearchToken.query.filter_by(entry_id=entry_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def search(session_id, tokens, limit=50, offset=0, encrypted_only=False):
+        """Get (entry_id, matches) for entries containing any of the tokens, best matches and newest first."""
+        from models import JournalEntry
+
+        if not tokens:
+            return []
+
+        matches = db.func.count(JournalSearchToken.token).label('matches')
+        query = db.session.query(JournalSearchToken.entry_id, matches)\
+            .join(JournalEntry, JournalEntry.id == JournalSearchToken.entry_id)\
+            .filter(JournalSearchToken.session_id == session_id)\
+            .filter(JournalSearchToken.token.in_(list(tokens)))
+        if encrypted_only:
+            query = query.filter(JournalEntry.is_encrypted.is_(True))
+
+        return query.group_by(JournalSearchToken.entry_id, JournalEntry.created_at)\
+            .order_by(matches.desc(), JournalEntry.created_at.desc(), JournalSearchToken.entry_id.desc())\
+            .limit(limit)\
+            .offset(offset)\
+            .all()
@@ -0,0 +1,82 @@
+from datetime import datetime
+from models import db
+
+class MicroPlanFunnel(db.Model):
+    """Materialized per-plan, per-day funnel of micro-plan enrollments, rebuilt on a schedule."""
+    __tablename__ = 'micro_plan_funnels'
+
+    plan_id = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Integer, primary_key=True)
+    reached = db.Column(db.Integer, nullable=False, default=0)  # Enrollments that got to this day
+    completed = db.Column(db.Integer, nullable=False, default=0)  # Enrollments that finished this day
+    stalled = db.Column(db.Integer, nullable=False, default=0)  # Unfinished enrollments still on this day
+    task_users = db.Column(db.Integer, nullable=False, default=0)  # Enrollments with a task done on this day
+    tasks_completed = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'day': self.day,
+            'reached': self.reached,
+            'completed': self.completed,
+            'stalled': self.stalled,
+            'drop_off_rate': round((1 - self.completed / self.reached) * 100, 1) if self.reached else 0,
+            'task_users': self.task_users,
+            'tasks_completed': self.tasks_completed
+        }
+
+    @staticmethod
+    def get_funnels():
+        """Get the stored funnel rows grouped by plan, ordered by day."""
+        funnels = {}
+        for row in MicroPlanFunnel.query.order_by(MicroPlanFunnel.plan_id, MicroPlanFunnel.day):
+            funnels.setdefault(row.plan_id, []).append(row)
+        return funnels
+
+    @staticmethod
+    def refresh(durations):
+        """Rebuild every funnel from two GROUP BY queries and store it in one transaction.
+
+        `durations` maps plan ids to their number of days. Days are derived from how far
+        each enrollment has got (current_day), so no per-user rows are loaded.
+        """
+        from models import MicroPlanProgress, MicroPlanTaskCompletion
+
+        positions = {}
+        for plan_id, current_day, is_completed, count in db.session.query(
+                MicroPlanProgress.plan_id, MicroPlanProgress.current_day, MicroPlanProgress.is_completed,
+                db.func.count(MicroPlanProgress.id))\
+                .group_by(MicroPlanProgress.plan_id, MicroPlanProgress.current_day, MicroPlanProgress.is_completed):
+            positions.setdefault(plan_id, []).append((current_day or 1, bool(is_completed), count))
+
+        activity = {}
+        for plan_id, day, task_users, tasks_completed in db.session.query(
+                MicroPlanProgress.plan_id, MicroPlanTaskCompletion.day,
+                db.func.count(db.distinct(MicroPlanTaskCompletion.progress_id)),
+                db.func.count(MicroPlanTaskCompletion.id))\
+                .join(MicroPlanProgress, MicroPlanProgress.id == MicroPlanTaskCompletion.progress_id)\
+                .group_by(MicroPlanProgress.plan_id, MicroPlanTaskCompletion.day):
+            activity[(plan_id, day)] = (task_users, tasks_completed)
+
+        now = datetime.utcnow()
+        rows = []
+        for plan_id, duration_days in durations.items():
+            plan_positions = positions.get(plan_id, [])
+            for day in range(1, duration_days + 1):
+                task_users, tasks_completed = activity.get((plan_id, day), (0, 0))
+                rows.append({
+                    'plan_id': plan_id,
+                    'day': day,
+                    'reached': sum(count for current, done, count in plan_positions if done or current >= day),
+                    'completed': sum(count for current, done, count in plan_positions if done or current > day),
+                    'stalled': sum(count for current, done, count in plan_positions if not done and current == day),
+                    'task_users': task_users,
+                    'tasks_completed': tasks_completed,
+                    'refreshed_at': now
+                })
+
+        MicroPlanFunnel.query.delete()
+        if rows:
+            db.session.execute(db.insert(MicroPlanFunnel), rows)
+        db.session.commit()
+        return len(rows)
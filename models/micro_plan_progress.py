@@ -10,36 +10,75 @@ class MicroPlanProgress(db.Model):
     plan_id = db.Column(db.String(50), nullable=False)  # e.g., 'exam_stress_sos', 'sleep_reset', 'anxiety_grounding'
     enrolled_date = db.Column(db.DateTime, default=datetime.utcnow)
     current_day = db.Column(db.Integer, default=1)
-    completed_tasks = db.Column(db.Text, default='{}')  # JSON: {"day": [task_ids]}
+    completed_tasks = db.Column(db.Text, default='{}')  # Legacy JSON {"day": [task_ids]}, moved to MicroPlanTaskCompletion on load
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     is_completed = db.Column(db.Boolean, default=False)
     completion_date = db.Column(db.DateTime, nullable=True)
 
     def __repr__(self):
         return f'<MicroPlanProgress {self.session_id} - {self.plan_id} Day {self.current_day}>'
 
+    def mark_tasks_complete(self, tasks):
+        """Record completions for (day, task_id) pairs not yet completed. Runs in the caller's transaction.
+
+        Returns the pairs that were newly completed.
+        """
+        from models import MicroPlanTaskCompletion
+
+        done = {(day, task_id) for day, tasks_for_day in self.get_completed_tasks().items() for task_id in tasks_for_day}
+        new = [pair for pair in dict.fromkeys(tasks) if pair not in done]
+        if new:
+            db.session.execute(db.insert(MicroPlanTaskCompletion), [
+                {'progress_id': self.id, 'day': day, 'task_id': task_id, 'completed_at': datetime.utcnow()}
+                for day, task_id in new
+            ])
+            # Incremented in SQL so concurrent completions don't overwrite each other's count
+            self.completed_count = MicroPlanProgress.completed_count + len(new)
+            db.session.flush()
+        return new
+
     def mark_task_complete(self, day, task_id):
         """Mark a specific task as completed for a given day."""
-        completed = json.loads(self.completed_tasks)
-        if str(day) not in completed:
-            completed[str(day)] = []
-
-        if task_id not in completed[str(day)]:
-            completed[str(day)].append(task_id)
-            self.completed_tasks = json.dumps(completed)
-            return True
-        return False
+        return bool(self.mark_tasks_complete([(day, task_id)]))
 
     def is_task_completed(self, day, task_id):
         """Check if a specific task is completed."""
-        completed = json.loads(self.completed_tasks)
-        day_str = str(day)
-        return day_str in completed and task_id in completed[day_str]
+        from models import MicroPlanTaskCompletion
+
+        return db.session.query(MicroPlanTaskCompletion.id)\
+            .filter_by(progress_id=self.id, day=day, task_id=task_id)\
+            .first() is not None
 
     def get_completed_tasks_for_day(self, day):
         """Get list of completed task IDs for a specific day."""
-        completed = json.loads(self.completed_tasks)
-        day_str = str(day)
-        return completed.get(day_str, [])
+        return self.get_completed_tasks().get(day, [])
+
+    def get_completed_tasks(self):
+        """Get {day: [task_ids]} for every completed task, with one query."""
+        from models import MicroPlanTaskCompletion
+
+        completed = {}
+        for day, task_id in db.session.query(MicroPlanTaskCompletion.day, MicroPlanTaskCompletion.task_id)\
+                .filter_by(progress_id=self.id)\
+                .order_by(MicroPlanTaskCompletion.id):
+            completed.setdefault(day, []).append(task_id)
+        return completed
+
+    def has_legacy_tasks(self):
+        """Whether completions are still stored in the legacy JSON column."""
+        return self.completed_tasks not in (None, '', '{}')
+
+    def migrate_legacy_tasks(self):
+        """Move completions from the JSON column into the completions table. Runs in the caller's transaction."""
+        try:
+            legacy = json.loads(self.completed_tasks) or {}
+        except ValueError:
+            legacy = {}
+
+        pairs = [(int(day), task_id) for day, task_ids in legacy.items() if str(day).isdigit()
+                 for task_id in task_ids if isinstance(task_id, str)]
+        self.mark_tasks_complete(pairs)
+        self.completed_tasks = '{}'
 
     def advance_day(self):
         """Move to the next day if all tasks for current day are completed."""
@@ -54,12 +93,17 @@ class MicroPlanProgress(db.Model):
 
     @staticmethod
     def get_user_progress(session_id, plan_id):
-        """Get progress for a specific user and plan."""
-        return MicroPlanProgress.query.filter_by(
+        """Get progress for a specific user and plan, moving legacy JSON completions over on first load."""
+        progress = MicroPlanProgress.query.filter_by(
             session_id=session_id,
             plan_id=plan_id
         ).first()
 
+        if progress and progress.has_legacy_tasks():
+            progress.migrate_legacy_tasks()
+            db.session.commit()
+        return progress
+
     @staticmethod
     def enroll_user(session_id, plan_id):
         """Enroll a user in a micro-plan."""
@@ -0,0 +1,13 @@
+from datetime import datetime
+from models import db
+
+class MicroPlanTaskCompletion(db.Model):
+    """One completed task of a micro-plan enrollment."""
+    __tablename__ = 'micro_plan_task_completions'
+    __table_args__ = (db.UniqueConstraint('progress_id', 'day', 'task_id', name='uq_micro_plan_task_completion'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    progress_id = db.Column(db.Integer, db.ForeignKey('micro_plan_progress.id'), nullable=False)
+    day = db.Column(db.Integer, nullable=False)
+    task_id = db.Column(db.String(100), nullable=False)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
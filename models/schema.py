@@ -0,0 +1,45 @@
+from sqlalchemy import inspect, text
+from models import db
+
+def upgrade_schema(new_tables=()):
+    """Add columns and indexes introduced after a table was first created.
+
+    db.create_all() only creates missing tables, so databases created by older
+    versions of the app get new columns and indexes added in place here.
+    `new_tables` names the tables db.create_all() has just created, so derived
+    tables can be filled from existing data.
+    """
+    inspector = inspect(db.engine)
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ''
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}'))
+
+    from models import UserBadge, BadgeEarnCount
+
+    # Earn counts are kept up to date by each award, so they start from the awards already made
+    recount = 'badge_earn_counts' in new_tables
+
+    # Before user_badges had a unique index it held progress rows and repeat awards; keep
+    # one award of each badge so the index can be built, then recount
+    if inspector.has_table('user_badges') and 'uq_user_badges_session_badge' not in \
+            {index['name'] for index in inspector.get_indexes('user_badges')}:
+        recount = UserBadge.remove_duplicates() > 0 or recount
+
+    if recount:
+        BadgeEarnCount.refresh()
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,22 @@
+from models import db
+
+class StudyPause(db.Model):
+    """One pause of a study session; resumed_at stays empty while the pause is ongoing."""
+    __tablename__ = 'study_pauses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    study_session_id = db.Column(db.Integer, db.ForeignKey('study_sessions.id'), nullable=False, index=True)
+    paused_at = db.Column(db.DateTime, nullable=False)
+    resumed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'paused_at': self.paused_at.isoformat(),
+            'resumed_at': self.resumed_at.isoformat() if self.resumed_at else None
+        }
+
+    @staticmethod
+    def close_open(study_session_id, resumed_at):
+        """End a session's ongoing pause, if any. Runs in the caller's transaction."""
+        StudyPause.query.filter_by(study_session_id=study_session_id, resumed_at=None)\
+            .update({'resumed_at': resumed_at}, synchronize_session=False)
@@ -2,8 +2,11 @@ from datetime import datetime, timedelta
 from models import db
 import json
 
+ROLLING_WINDOW = 7  # Days averaged by the heatmap's rolling series
+
 class StudySession(db.Model):
     __tablename__ = 'study_sessions'
+    __table_args__ = (db.Index('ix_study_sessions_session_start', 'session_id', 'start_time', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), nullable=False, index=True)
@@ -68,6 +71,14 @@ class StudySession(db.Model):
             .offset(offset)\
             .all()
 
+    @staticmethod
+    def get_user_sessions_page(session_id, limit=20, cursor=None, offset=0):
+        """Get a newest-first page of a user's study sessions and the cursor for the next page."""
+        from models.pagination import keyset_page
+
+        return keyset_page(StudySession.query.filter_by(session_id=session_id),
+                           StudySession.start_time, StudySession.id, limit, cursor, offset)
+
     @staticmethod
     def get_sessions_by_date_range(session_id, start_date, end_date):
         """Get sessions within a date range."""
@@ -99,30 +110,10 @@ class StudySession(db.Model):
 
     @staticmethod
     def get_study_streak(session_id):
-        """Calculate current study streak."""
-        from datetime import datetime, timedelta
-
-        # Get sessions from last 60 days
-        cutoff_date = datetime.utcnow() - timedelta(days=60)
-        sessions = StudySession.query.filter_by(session_id=session_id)\
-            .filter(StudySession.start_time >= cutoff_date)\
-            .order_by(StudySession.start_time.desc())\
-            .all()
-
-        if not sessions:
-            return 0
-
-        # Calculate streak
-        streak = 0
-        current_date = datetime.utcnow().date()
-        session_dates = {session.start_time.date() for session in sessions}
+        """Get current study streak from the session's day bitmap."""
+        from models import ActivityDays
 
-        while current_date in session_dates or (current_date - timedelta(days=1)) in session_dates:
-            if current_date in session_dates:
-                streak += 1
-            current_date -= timedelta(days=1)
-
-        return streak
+        return ActivityDays.get_current_streak(session_id, 'study')
 
     @staticmethod
     def get_average_productivity(session_id, days=30):
@@ -138,81 +129,236 @@ class StudySession(db.Model):
 
     @staticmethod
     def get_most_productive_time(session_id):
-        """Get the most productive time of day."""
-        sessions = StudySession.query.filter_by(session_id=session_id)\
-            .filter(StudySession.productivity_rating.isnot(None))\
-            .all()
+        """Get the most productive time of day, bucketing rated sessions by hour in SQL."""
+        hour = StudySession._start_hour()
+        hourly_stats = db.session.query(
+            hour,
+            db.func.sum(StudySession.productivity_rating),
+            db.func.count(StudySession.id)
+        )\
+        .filter(StudySession.session_id == session_id)\
+        .filter(StudySession.productivity_rating.isnot(None))\
+        .group_by(hour)\
+        .order_by(db.func.min(StudySession.id))\
+        .all()
 
-        if not sessions:
+        if not hourly_stats:
             return None
 
-        # Group by hour and calculate average productivity
-        hourly_stats = {}
-        for session in sessions:
-            hour = session.start_time.hour
-            if hour not in hourly_stats:
-                hourly_stats[hour] = {'total': 0, 'count': 0}
-            hourly_stats[hour]['total'] += session.productivity_rating
-            hourly_stats[hour]['count'] += 1
-
-        # Find hour with highest average productivity
+        # Find hour with highest average productivity; ties go to the hour studied first
         best_hour = None
         best_avg = 0
-        for hour, stats in hourly_stats.items():
-            avg = stats['total'] / stats['count']
+        for hour_of_day, total, count in hourly_stats:
+            avg = total / count
             if avg > best_avg:
                 best_avg = avg
-                best_hour = hour
+                best_hour = hour_of_day
 
         return {
             'hour': best_hour,
             'average_productivity': round(best_avg, 1),
-            'total_sessions': len(sessions)
+            'total_sessions': sum(count for _, _, count in hourly_stats)
         }
 
     @staticmethod
-    def get_study_stats(session_id, days=30):
-        """Get comprehensive study statistics."""
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-
-        # Basic stats
-        total_sessions = StudySession.query.filter_by(session_id=session_id)\
-            .filter(StudySession.start_time >= cutoff_date)\
-            .count()
+    def _start_hour():
+        """SQL expression for the hour of day a session started."""
+        if db.engine.dialect.name == 'sqlite':
+            return db.cast(db.func.strftime('%H', StudySession.start_time), db.Integer)
+        return db.cast(db.extract('hour', StudySession.start_time), db.Integer)
 
-        total_time = StudySession.get_total_study_time(session_id, days)
-        avg_session_length = total_time / total_sessions if total_sessions > 0 else 0
+    @staticmethod
+    def _start_date():
+        """SQL expression for the calendar day a session started."""
+        if db.engine.dialect.name == 'sqlite':
+            return db.func.date(StudySession.start_time)
+        return db.cast(StudySession.start_time, db.Date)
 
-        # Subject breakdown
-        subject_stats = db.session.query(
+    @staticmethod
+    def get_study_heatmap(session_id, days=90):
+        """Get an hour-by-weekday heatmap, daily rolling averages and per-subject weekly trends.
+
+        One query aggregates finished sessions by (day, hour, subject); every series is
+        then folded from those rows, so the work is bounded by days studied rather than
+        by the number of sessions.
+        """
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=days - 1)
+        day_column = StudySession._start_date()
+        hour_column = StudySession._start_hour()
+        has_mood = db.and_(StudySession.mood_before.isnot(None), StudySession.mood_after.isnot(None))
+
+        rows = db.session.query(
+            day_column,
+            hour_column,
             StudySession.subject,
             db.func.count(StudySession.id),
-            db.func.sum(StudySession.duration)
+            db.func.sum(StudySession.duration),
+            db.func.sum(StudySession.productivity_rating),
+            db.func.count(StudySession.productivity_rating),
+            db.func.sum(StudySession.mood_after - StudySession.mood_before),
+            db.func.sum(db.case((has_mood, 1), else_=0))
         )\
         .filter(StudySession.session_id == session_id)\
-        .filter(StudySession.start_time >= cutoff_date)\
-        .filter(StudySession.subject.isnot(None))\
-        .group_by(StudySession.subject)\
+        .filter(StudySession.start_time >= datetime.combine(first_day, datetime.min.time()))\
+        .filter(StudySession.duration > 0)\
+        .group_by(day_column, hour_column, StudySession.subject)\
         .all()
 
+        def cells():
+            return [[0] * 24 for _ in range(7)]
+
+        # Weekly subject trends use whole weeks ending today, so no bucket is partial;
+        # any leftover days at the start of the window only feed the heatmap and daily series
+        weeks = max(days // 7, 1)
+        first_week_offset = days - weeks * 7
+        slot_seconds, slot_sessions = cells(), cells()
+        slot_rating_sum, slot_rating_count = cells(), cells()
+        slot_mood_sum, slot_mood_count = cells(), cells()
+        day_seconds, day_sessions = [0] * days, [0] * days
+        day_rating_sum, day_rating_count = [0] * days, [0] * days
+        subject_weeks = {}
+
+        for day, hour, subject, count, seconds, rating_sum, rating_count, mood_sum, mood_count in rows:
+            day = day if not isinstance(day, str) else datetime.strptime(day, '%Y-%m-%d').date()
+            offset = (day - first_day).days
+            if not 0 <= offset < days:
+                continue
+            weekday = day.weekday()
+
+            slot_seconds[weekday][hour] += seconds or 0
+            slot_sessions[weekday][hour] += count
+            slot_rating_sum[weekday][hour] += rating_sum or 0
+            slot_rating_count[weekday][hour] += rating_count
+            slot_mood_sum[weekday][hour] += mood_sum or 0
+            slot_mood_count[weekday][hour] += mood_count or 0
+
+            day_seconds[offset] += seconds or 0
+            day_sessions[offset] += count
+            day_rating_sum[offset] += rating_sum or 0
+            day_rating_count[offset] += rating_count
+
+            if subject is not None and offset >= first_week_offset:
+                subject_weeks.setdefault(subject, [0] * weeks)[(offset - first_week_offset) // 7] += seconds or 0
+
+        def average(total, count):
+            return round(total / count, 2) if count else None
+
+        heatmap = {
+            'minutes': [[round(value / 60, 1) for value in row] for row in slot_seconds],
+            'sessions': slot_sessions,
+            'productivity': [[average(slot_rating_sum[w][h], slot_rating_count[w][h]) for h in range(24)] for w in range(7)],
+            'mood_delta': [[average(slot_mood_sum[w][h], slot_mood_count[w][h]) for h in range(24)] for w in range(7)]
+        }
+
+        best_slot = None
+        for weekday in range(7):
+            for hour in range(24):
+                rating = heatmap['productivity'][weekday][hour]
+                if rating is not None and (best_slot is None or rating > best_slot['average_productivity']):
+                    best_slot = {'weekday': weekday, 'hour': hour, 'average_productivity': rating}
+
+        # Trailing ROLLING_WINDOW-day averages, kept as running sums over the daily series
+        daily = []
+        window_seconds = window_rating_sum = window_rating_count = 0
+        for offset in range(days):
+            window_seconds += day_seconds[offset]
+            window_rating_sum += day_rating_sum[offset]
+            window_rating_count += day_rating_count[offset]
+            if offset >= ROLLING_WINDOW:
+                window_seconds -= day_seconds[offset - ROLLING_WINDOW]
+                window_rating_sum -= day_rating_sum[offset - ROLLING_WINDOW]
+                window_rating_count -= day_rating_count[offset - ROLLING_WINDOW]
+
+            daily.append({
+                'date': (first_day + timedelta(days=offset)).isoformat(),
+                'minutes': round(day_seconds[offset] / 60, 1),
+                'sessions': day_sessions[offset],
+                'rolling_minutes': round(window_seconds / 60 / min(offset + 1, ROLLING_WINDOW), 1),
+                'rolling_productivity': average(window_rating_sum, window_rating_count)
+            })
+
         subjects = []
-        for subject, count, time in subject_stats:
+        for subject, seconds_by_week in sorted(subject_weeks.items()):
+            minutes_by_week = [round(value / 60, 1) for value in seconds_by_week]
             subjects.append({
                 'subject': subject,
-                'sessions': count,
-                'total_time': time,
-                'average_time': time / count if count > 0 else 0
+                'weekly_minutes': minutes_by_week,
+                'total_minutes': round(sum(minutes_by_week), 1),
+                'trend': StudySession._slope(minutes_by_week)
             })
 
-        # Mood impact
-        mood_entries = StudySession.query.filter_by(session_id=session_id)\
-            .filter(StudySession.start_time >= cutoff_date)\
-            .filter(StudySession.mood_before.isnot(None))\
-            .filter(StudySession.mood_after.isnot(None))\
-            .all()
+        return {
+            'period_days': days,
+            'start_date': first_day.isoformat(),
+            'weeks_start_date': (first_day + timedelta(days=max(first_week_offset, 0))).isoformat(),
+            'weekdays': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+            'heatmap': heatmap,
+            'best_slot': best_slot,
+            'daily': daily,
+            'subjects': subjects
+        }
+
+    @staticmethod
+    def _slope(values):
+        """Least-squares slope of evenly spaced values, in units per step."""
+        n = len(values)
+        if n < 2:
+            return 0
+        mean_x = (n - 1) / 2
+        mean_y = sum(values) / n
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+        variance = sum((x - mean_x) ** 2 for x in range(n))
+        return round(covariance / variance, 2)
+
+    @staticmethod
+    def get_study_stats(session_id, days=30):
+        """Get comprehensive study statistics.
 
-        mood_improvements = sum(1 for s in mood_entries if s.mood_after > s.mood_before)
-        mood_declines = sum(1 for s in mood_entries if s.mood_after < s.mood_before)
+        The window is summarised with one GROUP BY subject query, totals being the sum of
+        the groups, and the best hour with one all-time GROUP BY hour query.
+        """
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        rated = StudySession.productivity_rating.isnot(None)
+        has_mood = db.and_(StudySession.mood_before.isnot(None), StudySession.mood_after.isnot(None))
+
+        subject_rows = db.session.query(
+            StudySession.subject,
+            db.func.count(StudySession.id),
+            db.func.coalesce(db.func.sum(StudySession.duration), 0),
+            db.func.sum(StudySession.productivity_rating),
+            db.func.count(StudySession.productivity_rating),
+            db.func.sum(db.case((has_mood, 1), else_=0)),
+            db.func.sum(db.case((db.and_(has_mood, StudySession.mood_after > StudySession.mood_before), 1), else_=0)),
+            db.func.sum(db.case((db.and_(has_mood, StudySession.mood_after < StudySession.mood_before), 1), else_=0))
+        )\
+        .filter(StudySession.session_id == session_id)\
+        .filter(StudySession.start_time >= cutoff_date)\
+        .group_by(StudySession.subject)\
+        .order_by(StudySession.subject)\
+        .all()
+
+        total_sessions = total_time = productivity_sum = productivity_count = 0
+        mood_entries = mood_improvements = mood_declines = 0
+        subjects = []
+        for subject, count, time, prod_sum, prod_count, moods, improvements, declines in subject_rows:
+            total_sessions += count
+            total_time += time
+            productivity_sum += prod_sum or 0
+            productivity_count += prod_count
+            mood_entries += moods or 0
+            mood_improvements += improvements or 0
+            mood_declines += declines or 0
+            if subject is not None:
+                subjects.append({
+                    'subject': subject,
+                    'sessions': count,
+                    'total_time': time,
+                    'average_time': time / count if count > 0 else 0
+                })
+
+        avg_session_length = total_time / total_sessions if total_sessions > 0 else 0
+        avg_productivity = productivity_sum / productivity_count if productivity_count else 0
 
         return {
             'period_days': days,
@@ -222,9 +368,9 @@ class StudySession(db.Model):
             'average_session_length': avg_session_length,
             'average_session_formatted': StudySession._format_total_time(int(avg_session_length)),
             'current_streak': StudySession.get_study_streak(session_id),
-            'average_productivity': StudySession.get_average_productivity(session_id, days),
+            'average_productivity': round(avg_productivity, 1) if avg_productivity else 0,
             'subjects': subjects,
-            'mood_entries_count': len(mood_entries),
+            'mood_entries_count': mood_entries,
             'mood_improvements': mood_improvements,
             'mood_declines': mood_declines,
             'most_productive_time': StudySession.get_most_productive_time(session_id)
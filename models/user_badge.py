@@ -3,6 +3,8 @@ from models import db
 
 class UserBadge(db.Model):
     __tablename__ = 'user_badges'
+    # A unique index rather than a constraint so upgrade_schema() can add it to existing tables
+    __table_args__ = (db.Index('uq_user_badges_session_badge', 'session_id', 'badge_id', unique=True),)
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), nullable=False, index=True)
@@ -29,6 +31,8 @@ class UserBadge(db.Model):
     @staticmethod
     def get_user_badges(session_id):
         """Get all badges earned by a user."""
+        from models import Badge
+
         return UserBadge.query.filter_by(session_id=session_id, is_earned=True)\
             .join(Badge)\
             .order_by(UserBadge.earned_at.desc())\
@@ -41,7 +45,6 @@ class UserBadge(db.Model):
 
         user_badges = {}
         earned_badges = UserBadge.query.filter_by(session_id=session_id, is_earned=True).all()
-        all_badges = Badge.query.filter_by(is_active=True).all()
 
         # Mark earned badges
         for user_badge in earned_badges:
@@ -51,10 +54,13 @@ class UserBadge(db.Model):
                 'progress': user_badge.progress_value
             }
 
-        # Add unearned badges with progress
-        for badge in all_badges:
+        # Add unearned badges with progress, all mapped from one aggregate pass
+        counters = None
+        for badge in Badge.get_catalog().badges:
             if badge.id not in user_badges:
-                progress = UserBadge._calculate_progress(session_id, badge)
+                if counters is None:
+                    counters, streaks = UserBadge._get_progress_counters(session_id)
+                progress = UserBadge._progress_from_counters(badge, counters, streaks)
                 user_badges[badge.id] = {
                     'earned': False,
                     'progress': progress,
@@ -64,186 +70,149 @@ class UserBadge(db.Model):
         return user_badges
 
     @staticmethod
-    def _calculate_progress(session_id, badge):
-        """Calculate user's progress towards a specific badge."""
-        from models import MoodEntry, JournalEntry, Conversation, MicroPlanProgress, StudySession
+    def _get_progress_counters(session_id):
+        """Get activity counters from the aggregate pass and streaks from the day bitmaps,
+        memoized for the current request."""
+        from flask import g, has_app_context
+        from models import ActivityCounter, ActivityDays
+
+        def compute():
+            return ActivityCounter.compute_session_counters(session_id), ActivityDays.get_streaks(session_id)
+
+        if not has_app_context():
+            return compute()
+
+        memo = g.setdefault('badge_progress_counters', {})
+        if session_id not in memo:
+            memo[session_id] = compute()
+        return memo[session_id]
+
+    @staticmethod
+    def _progress_from_counters(badge, counters, streaks):
+        """Calculate progress towards a badge from a session's activity counters and streaks."""
+        def count(activity):
+            counter = counters.get(activity)
+            return counter.count if counter else 0
 
         if badge.criteria_type == 'count':
-            if badge.category == 'mood':
-                return MoodEntry.query.filter_by(session_id=session_id).count()
-            elif badge.category == 'journal':
-                return JournalEntry.query.filter_by(session_id=session_id).count()
-            elif badge.category == 'chat':
-                return Conversation.query.filter_by(session_id=session_id).count()
-            elif badge.category == 'wellness':
-                return MicroPlanProgress.query.filter_by(session_id=session_id)\
-                    .filter_by(is_completed=True).count()
-            elif badge.category == 'study':
-                return StudySession.query.filter_by(session_id=session_id).count()
+            return count(badge.category)
 
         elif badge.criteria_type == 'streak':
             if badge.category == 'mood':
-                return UserBadge._calculate_mood_streak(session_id)
+                return streaks['mood']['current']
             elif badge.category == 'streak':
-                # Generic streak across all activities
-                return max(
-                    UserBadge._calculate_mood_streak(session_id),
-                    UserBadge._calculate_journal_streak(session_id),
-                    UserBadge._calculate_study_streak(session_id)
-                )
+                # Consecutive days with any activity at all
+                return streaks['any']['current']
 
         elif badge.criteria_type == 'time':
             if badge.category == 'study':
-                total_time = db.session.query(db.func.sum(StudySession.duration))\
-                    .filter(StudySession.session_id == session_id)\
-                    .scalar() or 0
-                return total_time // 60  # Convert to minutes
+                counter = counters.get('study')
+                return (counter.total if counter else 0) // 60  # Convert to minutes
 
         elif badge.criteria_type == 'milestone':
             if badge.name == 'Mood Improver':
-                return UserBadge._calculate_mood_improvement_count(session_id)
+                return count('mood_improvement')
 
         return 0
 
     @staticmethod
-    def _calculate_mood_streak(session_id):
-        """Calculate current mood logging streak."""
-        from models import MoodEntry
-        from datetime import datetime, timedelta
-
-        # Get mood entries from last 60 days
-        cutoff_date = datetime.utcnow() - timedelta(days=60)
-        entries = MoodEntry.query.filter_by(session_id=session_id)\
-            .filter(MoodEntry.created_at >= cutoff_date)\
-            .order_by(MoodEntry.created_at.desc())\
-            .all()
-
-        if not entries:
-            return 0
+    def find_unearned_badges(counters, streaks, earned_ids):
+        """Get (badge, progress) for every active badge whose criteria are met but is not yet earned."""
+        from models import Badge
 
-        # Calculate streak
-        streak = 0
-        current_date = datetime.utcnow().date()
-        entry_dates = {entry.created_at.date() for entry in entries}
+        qualified = []
+        for badge in Badge.get_catalog().badges:
+            if badge.id in earned_ids:
+                continue
 
-        while current_date in entry_dates or (current_date - timedelta(days=1)) in entry_dates:
-            if current_date in entry_dates:
-                streak += 1
-            current_date -= timedelta(days=1)
+            progress = UserBadge._progress_from_counters(badge, counters, streaks)
+            if progress >= badge.criteria_value:
+                qualified.append((badge, progress))
 
-        return streak
+        return qualified
 
     @staticmethod
-    def _calculate_journal_streak(session_id):
-        """Calculate current journal writing streak."""
-        from models import JournalEntry
-        from datetime import datetime, timedelta
-
-        cutoff_date = datetime.utcnow() - timedelta(days=60)
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.created_at >= cutoff_date)\
-            .order_by(JournalEntry.created_at.desc())\
-            .all()
-
-        if not entries:
-            return 0
-
-        streak = 0
-        current_date = datetime.utcnow().date()
-        entry_dates = {entry.created_at.date() for entry in entries}
+    def check_and_award_badges(session_id, counters=None):
+        """Check if user has earned any new badges and award them.
+
+        Progress comes from the session's activity counters and day bitmaps, so
+        evaluation is an in-memory comparison against the cached badge definitions.
+        """
+        from sqlalchemy.exc import IntegrityError
+        from models import ActivityCounter, ActivityDays, BadgeEarnCount
+
+        if counters is None:
+            counters = ActivityCounter.get_session_counters(session_id) or ActivityCounter.rebuild_session(session_id)
+        streaks = ActivityDays.get_streaks(session_id)
+
+        for attempt in range(2):
+            rows = {row.badge_id: row for row in UserBadge.query.filter_by(session_id=session_id)}
+            earned_ids = {badge_id for badge_id, row in rows.items() if row.is_earned}
+
+            earned_badges = []
+            for badge, progress in UserBadge.find_unearned_badges(counters, streaks, earned_ids):
+                row = rows.get(badge.id)
+                if row is not None:
+                    # A progress row left by the old badge engine holds this (session, badge) key
+                    row.is_earned = True
+                    row.earned_at = datetime.utcnow()
+                    row.progress_value = progress
+                else:
+                    db.session.add(UserBadge(session_id=session_id, badge_id=badge.id, progress_value=progress))
+                earned_badges.append(badge)
 
-        while current_date in entry_dates or (current_date - timedelta(days=1)) in entry_dates:
-            if current_date in entry_dates:
-                streak += 1
-            current_date -= timedelta(days=1)
+            if not earned_badges:
+                return earned_badges
 
-        return streak
+            try:
+                BadgeEarnCount.increment(badge.id for badge in earned_badges)
+                db.session.commit()
+                return earned_badges
+            except IntegrityError:
+                # The badge worker or another request awarded one of these first. The rollback
+                # drops the earn-count increments too; the retry awards whatever is left
+                db.session.rollback()
+                if attempt:
+                    raise
 
     @staticmethod
-    def _calculate_study_streak(session_id):
-        """Calculate current study session streak."""
-        from models import StudySession
-        from datetime import datetime, timedelta
-
-        cutoff_date = datetime.utcnow() - timedelta(days=60)
-        sessions = StudySession.query.filter_by(session_id=session_id)\
-            .filter(StudySession.created_at >= cutoff_date)\
-            .order_by(StudySession.created_at.desc())\
-            .all()
-
-        if not sessions:
-            return 0
-
-        streak = 0
-        current_date = datetime.utcnow().date()
-        session_dates = {session.created_at.date() for session in sessions}
-
-        while current_date in session_dates or (current_date - timedelta(days=1)) in session_dates:
-            if current_date in session_dates:
-                streak += 1
-            current_date -= timedelta(days=1)
+    def recompute_and_award_badges(session_id):
+        """Rebuild a session's activity counters and day bitmaps from scratch, then award any missing badges."""
+        from models import ActivityCounter, ActivityDays
 
-        return streak
+        counters = ActivityCounter.rebuild_session(session_id)
+        ActivityDays.rebuild_session(session_id)
+        return UserBadge.check_and_award_badges(session_id, counters)
 
     @staticmethod
-    def _calculate_mood_improvement_count(session_id):
-        """Calculate number of journal entries showing mood improvement."""
-        from models import JournalEntry
+    def remove_duplicates():
+        """Clear the rows that would break the unique (session_id, badge_id) index. Runs in the caller's transaction.
 
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.mood_before.isnot(None))\
-            .filter(JournalEntry.mood_after.isnot(None))\
-            .all()
-
-        improvement_count = 0
-        for entry in entries:
-            if entry.mood_after > entry.mood_before:
-                improvement_count += 1
+        The old badge engine kept an is_earned=False progress row next to each award. Progress
+        now comes from the activity counters, so those rows are dropped and only awards are
+        kept, the first one where a badge was awarded twice. Returns the number of rows deleted.
+        """
+        removed = UserBadge.query.filter(UserBadge.is_earned.isnot(True)).delete(synchronize_session=False)
 
-        return improvement_count
+        first_ids = db.session.query(db.func.min(UserBadge.id))\
+            .group_by(UserBadge.session_id, UserBadge.badge_id)\
+            .scalar_subquery()
+        return removed + UserBadge.query.filter(UserBadge.id.notin_(first_ids)).delete(synchronize_session=False)
 
     @staticmethod
-    def check_and_award_badges(session_id):
-        """Check if user has earned any new badges and award them."""
-        from models import Badge
-
-        earned_badges = []
-
-        badges = Badge.query.filter_by(is_active=True).all()
-        for badge in badges:
-            # Check if user already has this badge
-            existing = UserBadge.query.filter_by(session_id=session_id, badge_id=badge.id, is_earned=True).first()
-            if existing:
-                continue
-
-            # Calculate current progress
-            progress = UserBadge._calculate_progress(session_id, badge)
-
-            # Check if criteria is met
-            if progress >= badge.criteria_value:
-                # Award the badge
-                user_badge = UserBadge(session_id=session_id, badge_id=badge.id, progress_value=progress)
-                db.session.add(user_badge)
-                earned_badges.append(badge)
-            else:
-                # Update progress if not earned yet
-                progress_badge = UserBadge.query.filter_by(session_id=session_id, badge_id=badge.id, is_earned=False).first()
-                if progress_badge:
-                    progress_badge.progress_value = progress
-                else:
-                    progress_badge = UserBadge(session_id=session_id, badge_id=badge.id, progress_value=progress)
-                    progress_badge.is_earned = False
-                    db.session.add(progress_badge)
-
-        if earned_badges:
-            db.session.commit()
-
-        return earned_badges
+    def get_earned_since(session_id, cursor=0, limit=50):
+        """Get badges earned after a cursor (the last UserBadge id the client has seen)."""
+        return UserBadge.query.filter_by(session_id=session_id, is_earned=True)\
+            .filter(UserBadge.id > cursor)\
+            .order_by(UserBadge.id)\
+            .limit(limit)\
+            .all()
 
     @staticmethod
     def get_recently_earned_badges(session_id, days=7):
         """Get badges earned in the last N days."""
         from datetime import datetime, timedelta
+        from models import Badge
 
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         return UserBadge.query.filter_by(session_id=session_id, is_earned=True)\
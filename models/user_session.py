@@ -13,6 +13,7 @@ class UserSession(db.Model):
     language = db.Column(db.String(10), default='en')
     mood_history = db.Column(db.Text, default='[]')  # JSON string for mood check-ins
     preferences = db.Column(db.Text, default='{}')  # JSON string for user preferences
+    next_mood_reminder_at = db.Column(db.DateTime, nullable=True, index=True)  # Precomputed by WellnessTracker
 
     def update_activity(self):
         self.last_activity = datetime.utcnow()
@@ -27,6 +28,12 @@ class UserSession(db.Model):
     def get_mood_history(self):
         return json.loads(self.mood_history)
 
+    def get_last_mood_time(self):
+        history = json.loads(self.mood_history)
+        if not history:
+            return None
+        return max(datetime.fromisoformat(entry['date']) for entry in history)
+
     def set_preference(self, key, value):
         prefs = json.loads(self.preferences)
         prefs[key] = value
@@ -0,0 +1,173 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+from sqlalchemy.exc import IntegrityError
+from models import db, UserSession, UserBadge, ActivityCounter, ActivityDays, BadgeEarnCount
+
+class BadgeBackfill:
+    """Re-evaluate every session against the current badge definitions.
+
+    Worker processes only read: each one evaluates a chunk of sessions and returns
+    the badges to award. The parent inserts each chunk's awards in bulk and advances
+    the checkpoint in order, so SQLite only ever sees one writer and an interrupted
+    run resumes after the last committed chunk.
+    """
+    _app = None  # Per worker process
+
+    @staticmethod
+    def init_worker():
+        """Process pool initializer: give each worker its own app and database engine."""
+        from app import create_app
+        BadgeBackfill._app = create_app()
+
+    @staticmethod
+    def evaluate_chunk(session_ids):
+        """Evaluate a chunk of sessions in a worker process."""
+        with BadgeBackfill._app.app_context():
+            try:
+                return BadgeBackfill.find_awards(session_ids)
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def find_awards(session_ids):
+        """Get the UserBadge rows to insert for a chunk of sessions, computed from the source tables."""
+        earned = {}
+        for session_id, badge_id in db.session.query(UserBadge.session_id, UserBadge.badge_id)\
+                .filter(UserBadge.session_id.in_(session_ids), UserBadge.is_earned.is_(True)):
+            earned.setdefault(session_id, set()).add(badge_id)
+
+        awards = []
+        for session_id in session_ids:
+            counters = ActivityCounter.compute_session_counters(session_id)
+            streaks = ActivityDays.streaks_from_days(ActivityDays.compute_session_days(session_id))
+            for badge, progress in UserBadge.find_unearned_badges(counters, streaks, earned.get(session_id, set())):
+                awards.append({'session_id': session_id, 'badge_id': badge.id, 'progress_value': progress})
+
+        return awards
+
+    @staticmethod
+    def iter_session_chunks(chunk_size, after=None):
+        """Stream session ids in order using keyset pagination, one chunk per query."""
+        while True:
+            query = db.session.query(UserSession.session_id).order_by(UserSession.session_id)
+            if after is not None:
+                query = query.filter(UserSession.session_id > after)
+
+            chunk = [row[0] for row in query.limit(chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+            after = chunk[-1]
+
+    @staticmethod
+    def save_awards(awards):
+        """Bulk insert awards and bump the materialized earn counts in one transaction.
+
+        Returns the number of awards saved, which leaves out any badges the badge worker
+        awarded while the chunk was being evaluated.
+        """
+        if awards:
+            try:
+                BadgeBackfill._insert_awards(awards)
+            except IntegrityError:
+                db.session.rollback()
+                existing = {(session_id, badge_id): is_earned for session_id, badge_id, is_earned in
+                            db.session.query(UserBadge.session_id, UserBadge.badge_id, UserBadge.is_earned)
+                            .filter(UserBadge.session_id.in_({award['session_id'] for award in awards}))}
+                # Progress rows left by the old badge engine are turned into awards in place
+                upgrades = [award for award in awards if existing.get((award['session_id'], award['badge_id'])) is False]
+                awards = [award for award in awards if (award['session_id'], award['badge_id']) not in existing]
+                if awards:
+                    BadgeBackfill._insert_awards(awards)
+                if upgrades:
+                    BadgeBackfill._upgrade_awards(upgrades)
+                awards += upgrades
+        db.session.commit()
+        return len(awards)
+
+    @staticmethod
+    def _insert_awards(awards):
+        now = datetime.utcnow()
+        db.session.execute(db.insert(UserBadge), [dict(award, earned_at=now, is_earned=True) for award in awards])
+        BadgeEarnCount.increment(award['badge_id'] for award in awards)
+
+    @staticmethod
+    def _upgrade_awards(awards):
+        now = datetime.utcnow()
+        for award in awards:
+            UserBadge.query.filter_by(session_id=award['session_id'], badge_id=award['badge_id'])\
+                .update({'is_earned': True, 'earned_at': now, 'progress_value': award['progress_value']},
+                        synchronize_session=False)
+        BadgeEarnCount.increment(award['badge_id'] for award in awards)
+
+    @staticmethod
+    def load_checkpoint(path):
+        if not os.path.exists(path):
+            return {'last_session_id': None, 'sessions': 0, 'awarded': 0}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_checkpoint(path, checkpoint):
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def run(checkpoint_path, chunk_size=500, workers=None, restart=False, report=print):
+        """Backfill badges for all sessions, resuming from the checkpoint unless `restart` is set."""
+        if restart and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        checkpoint = BadgeBackfill.load_checkpoint(checkpoint_path)
+        if checkpoint['last_session_id'] is not None:
+            report(f"Resuming after session {checkpoint['last_session_id']} "
+                   f"({checkpoint['sessions']} sessions already done)")
+
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        chunks = BadgeBackfill.iter_session_chunks(chunk_size, after=checkpoint['last_session_id'])
+        started = time.monotonic()
+        processed = 0
+
+        def commit_chunk(chunk, awards):
+            nonlocal processed
+            awarded = BadgeBackfill.save_awards(awards)
+            processed += len(chunk)
+            checkpoint['last_session_id'] = chunk[-1]
+            checkpoint['sessions'] += len(chunk)
+            checkpoint['awarded'] += awarded
+            BadgeBackfill.save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.monotonic() - started
+            report(f"{checkpoint['sessions']} sessions, {checkpoint['awarded']} badges awarded, "
+                   f"{processed / elapsed if elapsed else 0:.1f} sessions/s")
+
+        if workers <= 1:
+            for chunk in chunks:
+                commit_chunk(chunk, BadgeBackfill.find_awards(chunk))
+            return checkpoint
+
+        # Spawned workers open their own connections instead of inheriting the parent's
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=BadgeBackfill.init_worker) as executor:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append((chunk, executor.submit(BadgeBackfill.evaluate_chunk, chunk)))
+                # Keep a bounded number of chunks queued and commit them in order
+                if len(in_flight) >= workers * 2:
+                    done_chunk, future = in_flight.popleft()
+                    commit_chunk(done_chunk, future.result())
+
+            while in_flight:
+                done_chunk, future = in_flight.popleft()
+                commit_chunk(done_chunk, future.result())
+
+        return checkpoint
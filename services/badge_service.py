@@ -1,40 +1,132 @@
-from models import Badge, UserBadge, db
+from flask import current_app
+from datetime import datetime
+from models import Badge, UserBadge, ActivityCounter, ActivityDays, BadgeEarnCount, db
+from services.event_bus import EventBus
+from services.badge_worker import BadgeWorker
+
+# Domain events that feed the per-session activity counters and day bitmaps
+ACTIVITY_EVENTS = {
+    'mood_logged': 'mood',
+    'journal_created': 'journal',
+    'chat_message': 'chat',
+    'study_completed': 'study',
+    'plan_completed': 'wellness'
+}
+
+# Domain events that take an activity back out of the counters. Earned badges are kept, and
+# day bitmaps keep the day, since the session was active on it
+REMOVAL_EVENTS = {
+    'journal_deleted': 'journal'
+}
 
 class BadgeService:
+    @staticmethod
+    def register_event_handlers():
+        """Subscribe the badge engine to activity domain events."""
+        for event_type in ACTIVITY_EVENTS:
+            # Day bitmaps are updated inline so streaks read right after a write are current
+            EventBus.register_handler(event_type, BadgeService.record_active_day)
+            EventBus.register_handler(event_type, BadgeService.handle_activity_event)
+        for event_type in REMOVAL_EVENTS:
+            # Through the same path as additions, so the badge worker applies them in order
+            EventBus.register_handler(event_type, BadgeService.handle_activity_event)
+
+    @staticmethod
+    def record_active_day(session_id, event):
+        """Mark the event's day in the session's activity bitmap."""
+        try:
+            ActivityDays.record(session_id, ACTIVITY_EVENTS[event['type']],
+                                when=datetime.fromisoformat(event['timestamp']))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def handle_activity_event(session_id, event):
+        """Hand a domain event to the badge worker, or apply it inline in synchronous mode."""
+        if current_app.config['BADGE_EVALUATION_MODE'] == 'sync':
+            BadgeService.apply_activity_events(session_id, [event])
+        else:
+            BadgeWorker.submit(session_id, event)
+
+    @staticmethod
+    def apply_activity_events(session_id, events):
+        """Update the session's activity counters for a batch of domain events, then evaluate badges once."""
+        try:
+            counters = ActivityCounter.get_session_counters(session_id)
+            if not counters:
+                # First events for this session: the rebuild already includes the new activity
+                counters = ActivityCounter.rebuild_session(session_id)
+            else:
+                for event in events:
+                    data = event['data']
+                    removed = event['type'] in REMOVAL_EVENTS
+                    activities = [REMOVAL_EVENTS[event['type']] if removed else ACTIVITY_EVENTS[event['type']]]
+                    if data.get('mood_improved'):
+                        activities.append('mood_improvement')
+
+                    for activity in activities:
+                        amount = data.get('duration', 0) if activity == 'study' else 0
+                        if removed:
+                            if activity in counters:
+                                counters[activity].unrecord(amount=amount)
+                            continue
+                        if activity not in counters:
+                            counters[activity] = ActivityCounter(session_id, activity)
+                            db.session.add(counters[activity])
+                        counters[activity].record(amount=amount)
+
+                db.session.commit()
+
+            return BadgeService.check_and_award_badges(session_id, counters)
+        except Exception:
+            db.session.rollback()
+            raise
+
     @staticmethod
     def create_badge(name, description, category, criteria_type, criteria_value, icon=None, color='primary'):
         """Create a new badge."""
         badge = Badge(name, description, category, criteria_type, criteria_value, icon, color)
         db.session.add(badge)
         db.session.commit()
+        Badge.invalidate_catalog()
         return badge
 
     @staticmethod
     def get_all_badges():
         """Get all active badges."""
-        return Badge.get_active_badges()
+        return Badge.get_catalog().badges
 
     @staticmethod
     def get_badges_by_category(category):
         """Get badges by category."""
-        return Badge.get_badges_by_category(category)
+        return Badge.get_catalog().by_category.get(category, ())
 
     @staticmethod
-    def get_user_badges(session_id):
-        """Get all badges earned by a user."""
-        user_badges = UserBadge.get_user_badges(session_id)
+    def _earned_badge_dicts(user_badges):
+        """Serialize earned user badges using the cached catalog instead of per-row badge lookups."""
+        catalog = Badge.get_catalog()
         badges = []
         for user_badge in user_badges:
-            badge_data = user_badge.badge.to_dict()
+            badge = catalog.by_id.get(user_badge.badge_id)
+            if not badge:
+                continue
+            badge_data = badge.to_dict()
             badge_data['earned_at'] = user_badge.earned_at.isoformat() if user_badge.earned_at else None
             badges.append(badge_data)
         return badges
 
+    @staticmethod
+    def get_user_badges(session_id):
+        """Get all badges earned by a user."""
+        return BadgeService._earned_badge_dicts(UserBadge.get_user_badges(session_id))
+
     @staticmethod
     def get_user_badge_progress(session_id):
         """Get user's progress towards all badges."""
         progress_data = UserBadge.get_user_badge_progress(session_id)
-        badges = Badge.get_active_badges()
+        badges = Badge.get_catalog().badges
 
         result = []
         for badge in badges:
@@ -46,35 +138,49 @@ class BadgeService:
         return result
 
     @staticmethod
-    def check_and_award_badges(session_id):
+    def check_and_award_badges(session_id, counters=None):
         """Check for new badges and award them."""
-        earned_badges = UserBadge.check_and_award_badges(session_id)
-        return [badge.to_dict() for badge in earned_badges]
+        earned_badges = [badge.to_dict() for badge in UserBadge.check_and_award_badges(session_id, counters)]
+        for badge_data in earned_badges:
+            EventBus.publish(session_id, 'badge_awarded', badge_data)
+        return earned_badges
+
+    @staticmethod
+    def recompute_badges(session_id):
+        """Repair a session's activity counters from the source tables and award missing badges."""
+        earned_badges = [badge.to_dict() for badge in UserBadge.recompute_and_award_badges(session_id)]
+        for badge_data in earned_badges:
+            EventBus.publish(session_id, 'badge_awarded', badge_data)
+        return earned_badges
+
+    @staticmethod
+    def get_new_badges(session_id, cursor=0):
+        """Get badges awarded after a cursor, with the cursor to poll with next."""
+        user_badges = UserBadge.get_earned_since(session_id, cursor)
+        return {
+            'badges': BadgeService._earned_badge_dicts(user_badges),
+            'cursor': user_badges[-1].id if user_badges else cursor
+        }
 
     @staticmethod
     def get_recently_earned_badges(session_id, days=7):
         """Get badges earned recently."""
-        user_badges = UserBadge.get_recently_earned_badges(session_id, days)
-        badges = []
-        for user_badge in user_badges:
-            badge_data = user_badge.badge.to_dict()
-            badge_data['earned_at'] = user_badge.earned_at.isoformat() if user_badge.earned_at else None
-            badges.append(badge_data)
-        return badges
+        return BadgeService._earned_badge_dicts(UserBadge.get_recently_earned_badges(session_id, days))
 
     @staticmethod
     def get_badge_stats(session_id):
         """Get badge statistics for a user."""
+        catalog = Badge.get_catalog()
         user_badges = UserBadge.get_user_badges(session_id)
-        all_badges = Badge.get_active_badges()
 
         earned_count = len(user_badges)
-        total_count = len(all_badges)
+        total_count = len(catalog.badges)
 
         # Category breakdown
         category_stats = {}
         for user_badge in user_badges:
-            category = user_badge.badge.category
+            badge = catalog.by_id.get(user_badge.badge_id)
+            category = badge.category if badge else 'unknown'
             if category not in category_stats:
                 category_stats[category] = 0
             category_stats[category] += 1
@@ -88,7 +194,7 @@ class BadgeService:
             'completion_percentage': (earned_count / total_count * 100) if total_count > 0 else 0,
             'category_breakdown': category_stats,
             'recent_badges_count': len(recent_badges),
-            'recent_badges': [badge.badge.name for badge in recent_badges]
+            'recent_badges': [catalog.by_id[badge.badge_id].name for badge in recent_badges if badge.badge_id in catalog.by_id]
         }
 
     @staticmethod
@@ -108,6 +214,7 @@ class BadgeService:
                 setattr(badge, key, value)
 
         db.session.commit()
+        Badge.invalidate_catalog()
         return badge
 
     @staticmethod
@@ -117,6 +224,7 @@ class BadgeService:
         if badge:
             db.session.delete(badge)
             db.session.commit()
+            Badge.invalidate_catalog()
             return True
         return False
 
@@ -125,20 +233,19 @@ class BadgeService:
         """Initialize default badges in the system."""
         return Badge.create_default_badges()
 
+    @staticmethod
+    def _get_badge_earn_stats():
+        """Get every active badge with its materialized earn count."""
+        counts = BadgeEarnCount.get_counts()
+        return [
+            {'badge': badge.to_dict(), 'earned_count': counts.get(badge.id, 0)}
+            for badge in Badge.get_catalog().badges
+        ]
+
     @staticmethod
     def get_leaderboard_badges(limit=10):
         """Get most earned badges across all users."""
-        # This would require aggregating user badges across sessions
-        # For now, return all badges with their earn counts
-        badges = Badge.get_active_badges()
-        badge_stats = []
-
-        for badge in badges:
-            earned_count = UserBadge.query.filter_by(badge_id=badge.id, is_earned=True).count()
-            badge_stats.append({
-                'badge': badge.to_dict(),
-                'earned_count': earned_count
-            })
+        badge_stats = BadgeService._get_badge_earn_stats()
 
         # Sort by earned count
         badge_stats.sort(key=lambda x: x['earned_count'], reverse=True)
@@ -152,16 +259,13 @@ class BadgeService:
     @staticmethod
     def get_rare_badges():
         """Get rarest badges (least earned)."""
-        badges = Badge.get_active_badges()
-        badge_stats = []
-
-        for badge in badges:
-            earned_count = UserBadge.query.filter_by(badge_id=badge.id, is_earned=True).count()
-            badge_stats.append({
-                'badge': badge.to_dict(),
-                'earned_count': earned_count
-            })
+        badge_stats = BadgeService._get_badge_earn_stats()
 
         # Sort by earned count (ascending)
         badge_stats.sort(key=lambda x: x['earned_count'])
         return badge_stats[:5]
+
+    @staticmethod
+    def refresh_earn_counts():
+        """Recompute materialized earn counts from user_badges."""
+        return BadgeEarnCount.refresh()
@@ -0,0 +1,77 @@
+import os
+import queue
+import threading
+from models import db
+
+class BadgeWorker:
+    """Background thread that applies activity events and evaluates badges off the request path.
+
+    Events are grouped per session while they wait, so a burst of writes from one user
+    is applied in a single pass with a single badge evaluation.
+    """
+    _app = None
+    _pending = {}  # session_id -> events waiting to be applied
+    _queue = queue.Queue()
+    _lock = threading.Lock()
+    _thread = None
+    _pid = None
+
+    @classmethod
+    def init_app(cls, app):
+        """Remember the app whose context the worker thread runs in."""
+        cls._app = app
+
+    @classmethod
+    def submit(cls, session_id, event):
+        """Queue an activity event; events for a session already waiting are coalesced."""
+        cls._ensure_started()
+
+        with cls._lock:
+            if session_id in cls._pending:
+                cls._pending[session_id].append(event)
+                return
+            cls._pending[session_id] = [event]
+
+        cls._queue.put(session_id)
+
+    @classmethod
+    def _ensure_started(cls):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive() and cls._pid == os.getpid():
+                return
+            cls._pid = os.getpid()
+            cls._thread = threading.Thread(target=cls._run, name='badge-worker', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def _run(cls):
+        from services.badge_service import BadgeService
+
+        while True:
+            session_id = cls._queue.get()
+            with cls._lock:
+                events = cls._pending.pop(session_id, [])
+
+            with cls._app.app_context():
+                try:
+                    BadgeService.apply_activity_events(session_id, events)
+                except Exception:
+                    cls._app.logger.exception(f"Badge evaluation failed for session {session_id}")
+                    cls._discard_counters(session_id)
+                finally:
+                    db.session.remove()
+
+    @classmethod
+    def _discard_counters(cls, session_id):
+        # The failed events are gone, so drop the session's counters rather than leave them
+        # short; the next event or badge check rebuilds them from the source tables
+        from models import ActivityCounter
+
+        try:
+            db.session.rollback()
+            ActivityCounter.clear_session(session_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            cls._app.logger.exception(f"Could not reset activity counters for session {session_id}")
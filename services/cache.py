@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Upper bound on how stale cached per-session stats can get: rows ageing out of their window,
+# and writes handled by another gunicorn worker, whose cache invalidation is process-local
+STATS_CACHE_TTL = 300
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class TTLCache:
+    """Per-session values keyed by a parameter such as `days`, each expiring `ttl` seconds after it was set.
+
+    A session's values are invalidated together, so a write drops every variant at once.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self._sessions = LRUCache(maxsize)  # session_id -> {key: (value, expires_at)}
+
+    def get(self, session_id, key, default=None):
+        entry = self._sessions.get(session_id, {}).get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return default
+        return entry[0]
+
+    def set(self, session_id, key, value):
+        # Replace rather than mutate the per-session dict so concurrent readers never see it change
+        entries = self._sessions.get(session_id, {})
+        self._sessions.set(session_id, {**entries, key: (value, time.monotonic() + self.ttl)})
+
+    def get_or_compute(self, session_id, key, compute):
+        """Return the cached value, or call `compute()` and cache its result."""
+        value = self.get(session_id, key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(session_id, key, value)
+        return value
+
+    def invalidate(self, session_id):
+        self._sessions.pop(session_id)
+
+    def clear(self):
+        self._sessions.clear()
+
+_MISSING = object()
@@ -0,0 +1,158 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context
+
+class EventBus:
+    """In-process pub/sub for per-session events (nudges, badge awards, timer state).
+
+    Subscribers are plain queues owned by the streaming request that created them, so
+    events only reach clients connected to the same worker process. Handlers are
+    server-side callbacks for domain events and run synchronously in the publisher.
+    """
+    _subscribers = {}
+    _handlers = {}
+    _lock = threading.Lock()
+    _open_streams = 0
+    MAX_QUEUE_SIZE = 100
+    BUSY_RETRY_MS = 60000  # Reconnect delay handed to clients turned away from a full worker
+
+    @classmethod
+    def subscribe(cls, session_id, types=None):
+        """Register a new listener queue for a session, for the given event types or all of them."""
+        listener = queue.Queue(maxsize=cls.MAX_QUEUE_SIZE)
+        listener.types = frozenset(types) if types else None
+        with cls._lock:
+            cls._subscribers.setdefault(session_id, set()).add(listener)
+        return listener
+
+    @classmethod
+    def unsubscribe(cls, session_id, listener):
+        """Remove a listener queue, dropping the session entry once it is empty."""
+        with cls._lock:
+            listeners = cls._subscribers.get(session_id)
+            if listeners:
+                listeners.discard(listener)
+                if not listeners:
+                    del cls._subscribers[session_id]
+
+    @classmethod
+    def register_handler(cls, event_type, handler):
+        """Call `handler(session_id, event)` whenever `event_type` is published."""
+        with cls._lock:
+            handlers = cls._handlers.setdefault(event_type, [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    @classmethod
+    def connected_sessions(cls):
+        """Get the sessions with at least one open listener."""
+        with cls._lock:
+            return list(cls._subscribers)
+
+    @classmethod
+    def has_subscribers(cls, session_id, event_type=None):
+        """Check whether any client is currently listening for a session, optionally for one event type."""
+        with cls._lock:
+            return any(cls._wants(listener, event_type) for listener in cls._subscribers.get(session_id, ()))
+
+    @staticmethod
+    def _wants(listener, event_type):
+        return event_type is None or listener.types is None or event_type in listener.types
+
+    @classmethod
+    def publish(cls, session_id, event_type, data=None):
+        """Publish an event to the session's listeners for its type. Returns the number of listeners reached."""
+        event = {
+            'type': event_type,
+            'data': data if data is not None else {},
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+        with cls._lock:
+            handlers = list(cls._handlers.get(event_type, ()))
+            listeners = [listener for listener in cls._subscribers.get(session_id, ()) if cls._wants(listener, event_type)]
+
+        for handler in handlers:
+            try:
+                handler(session_id, event)
+            except Exception:
+                logger = current_app.logger if has_app_context() else logging.getLogger(__name__)
+                logger.exception(f"Event handler {getattr(handler, '__qualname__', handler)} for {event_type} failed")
+
+        for listener in listeners:
+            try:
+                listener.put_nowait(event)
+            except queue.Full:
+                # Slow client: drop the oldest event rather than blocking the publisher
+                try:
+                    listener.get_nowait()
+                    listener.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+        return len(listeners)
+
+    @staticmethod
+    def format_sse(event):
+        """Format an event as a Server-Sent Events message."""
+        return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    @classmethod
+    def stream(cls, session_id, timeout=25, heartbeat=10, on_connect=None, max_streams=None, types=None):
+        """Yield SSE messages for a session until the timeout elapses.
+
+        The stream is closed after `timeout` seconds and the browser reconnects on its own,
+        which keeps a connection from pinning a worker thread indefinitely. `on_connect`
+        runs once after subscribing, so callers can publish initial state into the stream.
+
+        Every open stream holds a worker thread, so once `max_streams` are open a new
+        client gets only what `on_connect` publishes and is told to come back later,
+        leaving threads free for ordinary requests.
+
+        `types` limits the stream to the event types the client handles, so events it
+        would drop, such as nudges that are marked sent once published, are not sent to it.
+        """
+        with cls._lock:
+            busy = max_streams is not None and cls._open_streams >= max_streams
+            if not busy:
+                cls._open_streams += 1
+
+        listener = cls.subscribe(session_id, types)
+        try:
+            if busy:
+                yield f'retry: {cls.BUSY_RETRY_MS}\n\n'
+                if on_connect:
+                    on_connect()
+                while True:
+                    try:
+                        yield cls.format_sse(listener.get_nowait())
+                    except queue.Empty:
+                        return
+
+            yield 'retry: 3000\n\n'
+
+            if on_connect:
+                on_connect()
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                try:
+                    event = listener.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                yield cls.format_sse(event)
+        finally:
+            cls.unsubscribe(session_id, listener)
+            if not busy:
+                with cls._lock:
+                    cls._open_streams -= 1
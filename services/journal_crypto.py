@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import hmac
+import re
+import unicodedata
+from cryptography.fernet import Fernet
+from config import DEFAULT_SECRET_KEY
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db
+from models.compression import pack_text, unpack_text
+from models.journal_key import JournalKey
+from services.cache import LRUCache
+
+# Stored in JournalEntry.encryption_key for entries encrypted with their session's data key
+SESSION_KEY_MARKER = 'session:v1'
+
+# Words are runs of anything but whitespace and punctuation, so Devanagari vowel signs stay attached
+WORD_PATTERN = re.compile(r"[^\s.,;:!?\"'()\[\]{}<>/\\|@#$%^&*+=~`\-\u0964\u0965]+")
+MIN_WORD_LENGTH = 2
+
+class JournalCrypto:
+    """Envelope encryption for journal entries.
+
+    Each session has one data key, stored wrapped by the master key in journal_keys.
+    Unwrapped keys are kept in a bounded LRU so listing entries costs one key lookup
+    per session rather than a key decode and Fernet construction per entry.
+    """
+    _master = None
+    _master_source = None
+    _data_keys = None
+
+    @staticmethod
+    def check_master_key(app):
+        """Refuse to start with a malformed master key, or one derived from the default SECRET_KEY outside debug."""
+        master_key = app.config.get('JOURNAL_MASTER_KEY')
+        if master_key:
+            try:
+                Fernet(master_key.encode())
+            except ValueError:
+                raise RuntimeError("JOURNAL_MASTER_KEY must be a Fernet key (Fernet.generate_key())")
+            return
+
+        if app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY and not (app.debug or app.testing):
+            raise RuntimeError("JOURNAL_MASTER_KEY is not set and SECRET_KEY is the built-in default; "
+                               "journal entries would be encrypted with a publicly known key")
+        # Changing SECRET_KEY later would make every encrypted journal entry unreadable
+        app.logger.warning("JOURNAL_MASTER_KEY is not set; deriving the journal master key from SECRET_KEY")
+
+    @staticmethod
+    def get_master():
+        """Get the Fernet for the master key, derived from SECRET_KEY when none is configured."""
+        source = current_app.config.get('JOURNAL_MASTER_KEY') or current_app.config['SECRET_KEY']
+        if JournalCrypto._master is None or JournalCrypto._master_source != source:
+            if current_app.config.get('JOURNAL_MASTER_KEY'):
+                key = source.encode()
+            else:
+                key = base64.urlsafe_b64encode(hashlib.sha256(f'journal-master:{source}'.encode()).digest())
+            JournalCrypto._master = Fernet(key)
+            JournalCrypto._master_source = source
+        return JournalCrypto._master
+
+    @staticmethod
+    def get_index_key():
+        """Get the HMAC key for blind search tokens, kept separate from the encryption keys."""
+        source = current_app.config.get('JOURNAL_INDEX_KEY') or \
+            current_app.config.get('JOURNAL_MASTER_KEY') or current_app.config['SECRET_KEY']
+        return hashlib.sha256(f'journal-index:{source}'.encode()).digest()
+
+    @staticmethod
+    def normalize_words(text):
+        """Split text into distinct lowercase, NFKC-normalized words."""
+        text = unicodedata.normalize('NFKC', text or '').casefold()
+        return {word for word in WORD_PATTERN.findall(text) if len(word) >= MIN_WORD_LENGTH}
+
+    @staticmethod
+    def blind_tokens(session_id, text):
+        """Get the blind index tokens for the words in a text.
+
+        Tokens are keyed by session as well, so the same word gives unrelated tokens
+        for different users.
+        """
+        key = JournalCrypto.get_index_key()
+        return {
+            hmac.new(key, f'{session_id}:{word}'.encode(), hashlib.sha256).hexdigest()[:32]
+            for word in JournalCrypto.normalize_words(text)
+        }
+
+    @staticmethod
+    def _get_cache():
+        if JournalCrypto._data_keys is None:
+            JournalCrypto._data_keys = LRUCache(current_app.config['JOURNAL_KEY_CACHE_SIZE'])
+        return JournalCrypto._data_keys
+
+    @staticmethod
+    def get_fernet(session_id, create=False):
+        """Get the Fernet for a session's data key, creating the key on first write if asked."""
+        new_keys = db.session.info.get('new_journal_keys', {})
+        if session_id in new_keys:
+            return new_keys[session_id]
+
+        cache = JournalCrypto._get_cache()
+        fernet = cache.get(session_id)
+        if fernet is not None:
+            return fernet
+
+        wrapped_key = JournalKey.get_wrapped_key(session_id)
+        if wrapped_key is None:
+            if not create:
+                raise KeyError(f'No journal key for session {session_id}')
+            return JournalCrypto._create_key(session_id)
+
+        fernet = Fernet(JournalCrypto.get_master().decrypt(wrapped_key.encode()))
+        cache.set(session_id, fernet)
+        return fernet
+
+    @staticmethod
+    def _create_key(session_id):
+        """Store a new wrapped data key in the caller's transaction.
+
+        If a concurrent first write stored a key for the session already, that key is used
+        instead. The key is only cached once the transaction commits, so a rolled back write
+        can never leave a worker encrypting with a key that was not saved.
+        """
+        master = JournalCrypto.get_master()
+        wrapped_key = JournalKey.add_if_missing(session_id, master.encrypt(Fernet.generate_key()).decode())
+
+        fernet = Fernet(master.decrypt(wrapped_key.encode()))
+        db.session.info.setdefault('new_journal_keys', {})[session_id] = fernet
+        return fernet
+
+    @staticmethod
+    def encrypt(session_id, text):
+        return JournalCrypto.get_fernet(session_id, create=True).encrypt(pack_text(text)).decode()
+
+    @staticmethod
+    def decrypt(session_id, token):
+        return unpack_text(JournalCrypto.get_fernet(session_id).decrypt(token.encode()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_keys(session):
+    new_keys = session.info.pop('new_journal_keys', None)
+    if new_keys:
+        cache = JournalCrypto._get_cache()
+        for session_id, fernet in new_keys.items():
+            cache.set(session_id, fernet)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_keys(session):
+    session.info.pop('new_journal_keys', None)
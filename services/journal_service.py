@@ -1,8 +1,18 @@
-from models import JournalEntry, db
+from models import JournalEntry, JournalEntryTag, JournalSearchToken, ActivityDays, db
+from models.journal_entry import DECRYPTABLE_FIELDS
+from services.journal_crypto import JournalCrypto
+from services.event_bus import EventBus
+from services.cache import TTLCache, STATS_CACHE_TTL
 from datetime import datetime, timedelta
 import json
+import time
+import zipfile
+
+EXPORT_CHUNK_SIZE = 200
 
 class JournalService:
+    _stats_cache = TTLCache(STATS_CACHE_TTL, maxsize=4096)  # (session_id, days) -> stats
+
     @staticmethod
     def create_entry(session_id, content, title=None, mood_before=None, mood_after=None, tags=None, encrypt=True):
         """Create a new journal entry."""
@@ -19,14 +29,34 @@ class JournalService:
             entry.set_tags_list(tags)
 
         db.session.add(entry)
+        db.session.flush()
+        JournalService._index_entry(entry, title, content)
+        JournalEntryTag.set_entry_tags(entry.id, session_id, tags)
         db.session.commit()
+        JournalService.invalidate_journal_stats(session_id)
+
+        EventBus.publish(session_id, 'journal_created', {
+            'entry_id': entry.id,
+            'mood_improved': mood_before is not None and mood_after is not None and mood_after > mood_before
+        })
 
         return entry
 
     @staticmethod
-    def get_entries(session_id, limit=20, offset=0, decrypt=True):
+    def _index_entry(entry, title, content):
+        """Rebuild an entry's blind search tokens from its plaintext."""
+        tokens = JournalCrypto.blind_tokens(entry.session_id, f"{title or ''} {content or ''}")
+        JournalSearchToken.index_entry(entry.id, entry.session_id, tokens)
+
+    @staticmethod
+    def get_entries(session_id, limit=20, offset=0, decrypt=True, fields=DECRYPTABLE_FIELDS):
         """Get journal entries for a user."""
-        return JournalEntry.get_user_entries(session_id, limit, offset, decrypt)
+        return JournalEntry.get_user_entries(session_id, limit, offset, decrypt, fields)
+
+    @staticmethod
+    def get_entries_page(session_id, limit=20, cursor=None, offset=0, decrypt=True, fields=DECRYPTABLE_FIELDS):
+        """Get a page of journal entries and the cursor for the next page."""
+        return JournalEntry.get_user_entries_page(session_id, limit, cursor, offset, decrypt, fields)
 
     @staticmethod
     def get_entry_by_id(entry_id, session_id, decrypt=True):
@@ -44,9 +74,9 @@ class JournalService:
         if not entry:
             return None
 
-        # If entry is encrypted, we need to decrypt it first to update
-        if entry.is_encrypted and decrypt:
-            entry = entry.decrypt_content()
+        # Decrypt in place so the changes are made to the stored entry and re-encrypted below
+        if entry.is_encrypted:
+            entry.title, entry.content = entry.decrypt_fields()
 
         if content is not None:
             entry.content = content
@@ -58,14 +88,17 @@ class JournalService:
             entry.mood_after = mood_after
         if tags is not None:
             entry.set_tags_list(tags)
+            JournalEntryTag.set_entry_tags(entry.id, session_id, tags)
 
         entry.updated_at = datetime.utcnow()
+        JournalService._index_entry(entry, entry.title, entry.content)
 
         # Re-encrypt if it was originally encrypted
         if entry.is_encrypted:
             entry._encrypt_content()
 
         db.session.commit()
+        JournalService.invalidate_journal_stats(session_id)
         return entry
 
     @staticmethod
@@ -73,15 +106,90 @@ class JournalService:
         """Delete a journal entry."""
         entry = JournalEntry.query.filter_by(id=entry_id, session_id=session_id).first()
         if entry:
+            mood_improved = entry.mood_before is not None and entry.mood_after is not None and \
+                entry.mood_after > entry.mood_before
+            JournalSearchToken.remove_entry(entry.id)
+            JournalEntryTag.remove_entry(entry.id)
             db.session.delete(entry)
             db.session.commit()
+            JournalService.invalidate_journal_stats(session_id)
+
+            EventBus.publish(session_id, 'journal_deleted', {'entry_id': entry_id, 'mood_improved': mood_improved})
             return True
         return False
 
     @staticmethod
-    def search_entries(session_id, query, decrypt=True):
-        """Search journal entries."""
-        return JournalEntry.search_entries(session_id, query, decrypt)
+    def reencrypt_legacy_entries(batch_size=500, report=print):
+        """Move entries still encrypted with per-entry keys onto their session's data key.
+
+        Runs in id-ordered batches with one commit per batch, so it can be stopped and
+        rerun at any point. Returns (migrated, failed).
+        """
+        from services.journal_crypto import SESSION_KEY_MARKER
+
+        started = time.monotonic()
+        migrated = failed = 0
+        last_id = 0
+        while True:
+            batch = JournalEntry.query.filter(JournalEntry.id > last_id)\
+                .filter(JournalEntry.is_encrypted.is_(True))\
+                .filter(JournalEntry.encryption_key != SESSION_KEY_MARKER)\
+                .order_by(JournalEntry.id)\
+                .limit(batch_size)\
+                .all()
+            if not batch:
+                break
+
+            for entry in batch:
+                try:
+                    entry.reencrypt()
+                    migrated += 1
+                except Exception as e:
+                    print(f"Re-encryption failed for journal entry {entry.id}: {e}")
+                    failed += 1
+            last_id = batch[-1].id
+            db.session.commit()
+
+            elapsed = time.monotonic() - started
+            report(f"{migrated} entries re-encrypted, {failed} failed, "
+                   f"{migrated / elapsed if elapsed else 0:.1f} entries/s")
+
+        return migrated, failed
+
+    @staticmethod
+    def reindex_entries(batch_size=500, report=print):
+        """Rebuild the blind search index for every entry, in id-ordered batches."""
+        started = time.monotonic()
+        indexed = failed = 0
+        last_id = 0
+        while True:
+            batch = JournalEntry.query.filter(JournalEntry.id > last_id)\
+                .order_by(JournalEntry.id)\
+                .limit(batch_size)\
+                .all()
+            if not batch:
+                break
+
+            for entry in batch:
+                try:
+                    title, content = entry.decrypt_fields()
+                    JournalService._index_entry(entry, title, content)
+                    indexed += 1
+                except Exception as e:
+                    print(f"Indexing failed for journal entry {entry.id}: {e}")
+                    failed += 1
+            last_id = batch[-1].id
+            db.session.commit()
+
+            elapsed = time.monotonic() - started
+            report(f"{indexed} entries indexed, {failed} failed, {indexed / elapsed if elapsed else 0:.1f} entries/s")
+
+        return indexed, failed
+
+    @staticmethod
+    def search_entries(session_id, query, decrypt=True, limit=20, cursor=None):
+        """Search journal entries a page at a time."""
+        return JournalEntry.search_entries(session_id, query, decrypt, limit, cursor)
 
     @staticmethod
     def get_entries_by_tag(session_id, tag, decrypt=True):
@@ -105,55 +213,47 @@ class JournalService:
 
     @staticmethod
     def get_journal_stats(session_id, days=30):
-        """Get journal statistics."""
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-
-        # Basic stats
-        total_entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.created_at >= cutoff_date)\
-            .count()
+        """Get journal statistics, cached per (session, days) until the next journal write."""
+        return JournalService._stats_cache.get_or_compute(
+            session_id, days, lambda: JournalService._compute_journal_stats(session_id, days))
 
-        # Mood stats
-        entries_with_mood = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.created_at >= cutoff_date)\
-            .filter(JournalEntry.mood_before.isnot(None))\
-            .filter(JournalEntry.mood_after.isnot(None))\
-            .all()
-
-        mood_improvements = sum(1 for e in entries_with_mood if e.mood_after > e.mood_before)
-        mood_declines = sum(1 for e in entries_with_mood if e.mood_after < e.mood_before)
-
-        # Tag stats
-        all_tags = []
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.created_at >= cutoff_date)\
-            .all()
+    @staticmethod
+    def invalidate_journal_stats(session_id):
+        """Drop a session's cached stats after a journal write."""
+        JournalService._stats_cache.invalidate(session_id)
 
-        for entry in entries:
-            all_tags.extend(entry.get_tags_list())
+    @staticmethod
+    def _compute_journal_stats(session_id, days):
+        """Compute journal statistics with one aggregate over the entries and one GROUP BY over tags.
 
-        tag_counts = {}
-        for tag in all_tags:
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
+        Only the mood columns are read, never the (possibly encrypted) title or content.
+        """
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
 
-        top_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        has_mood = db.and_(JournalEntry.mood_before.isnot(None), JournalEntry.mood_after.isnot(None))
+        totals = db.session.query(
+            db.func.count(JournalEntry.id).label('total_entries'),
+            db.func.count(db.case((has_mood, 1))).label('entries_with_mood'),
+            db.func.count(db.case((db.and_(has_mood, JournalEntry.mood_after > JournalEntry.mood_before), 1)))
+                .label('mood_improvements'),
+            db.func.count(db.case((db.and_(has_mood, JournalEntry.mood_after < JournalEntry.mood_before), 1)))
+                .label('mood_declines'),
+            db.func.avg(db.case((has_mood, JournalEntry.mood_before))).label('average_mood_before'),
+            db.func.avg(db.case((has_mood, JournalEntry.mood_after))).label('average_mood_after')
+        ).filter(JournalEntry.session_id == session_id, JournalEntry.created_at >= cutoff_date).one()
 
-        # Average mood
-        if entries_with_mood:
-            avg_mood_before = sum(e.mood_before for e in entries_with_mood) / len(entries_with_mood)
-            avg_mood_after = sum(e.mood_after for e in entries_with_mood) / len(entries_with_mood)
-        else:
-            avg_mood_before = avg_mood_after = 0
+        # Tag stats
+        tag_counts = JournalEntryTag.get_top_tags(session_id, since=cutoff_date, limit=None)
 
         return {
             'period_days': days,
-            'total_entries': total_entries,
-            'entries_with_mood': len(entries_with_mood),
-            'mood_improvements': mood_improvements,
-            'mood_declines': mood_declines,
-            'average_mood_before': round(avg_mood_before, 1),
-            'average_mood_after': round(avg_mood_after, 1),
-            'top_tags': [{'tag': tag, 'count': count} for tag, count in top_tags],
+            'total_entries': totals.total_entries,
+            'entries_with_mood': totals.entries_with_mood,
+            'mood_improvements': totals.mood_improvements,
+            'mood_declines': totals.mood_declines,
+            'average_mood_before': round(totals.average_mood_before or 0, 1),
+            'average_mood_after': round(totals.average_mood_after or 0, 1),
+            'top_tags': [{'tag': tag, 'count': count} for tag, count in tag_counts[:10]],
             'unique_tags': len(tag_counts)
         }
 
@@ -164,11 +264,9 @@ class JournalService:
 
     @staticmethod
     def export_entries(session_id, start_date=None, end_date=None, decrypt=True):
-        """Export journal entries as JSON."""
-        if start_date and end_date:
-            entries = JournalEntry.get_entries_by_date_range(session_id, start_date, end_date, decrypt)
-        else:
-            entries = JournalEntry.get_user_entries(session_id, limit=1000, decrypt=decrypt)
+        """Export journal entries as JSON. Builds the whole export in memory; prefer the streaming exports."""
+        entries = [entry for chunk in JournalService.iter_export_chunks(session_id, start_date, end_date, decrypt)
+                   for entry in chunk]
 
         export_data = {
             'export_date': datetime.utcnow().isoformat(),
@@ -179,29 +277,78 @@ class JournalService:
 
         return export_data
 
+    @staticmethod
+    def iter_export_chunks(session_id, start_date=None, end_date=None, decrypt=True, chunk_size=EXPORT_CHUNK_SIZE):
+        """Yield a session's entries oldest first, one decrypted chunk at a time.
+
+        Pages with a (created_at, id) keyset rather than an offset, so each chunk costs
+        the same however deep into the history the export is.
+        """
+        last = None
+        while True:
+            query = JournalEntry.query.filter_by(session_id=session_id)
+            if start_date:
+                query = query.filter(JournalEntry.created_at >= start_date)
+            if end_date:
+                query = query.filter(JournalEntry.created_at <= end_date)
+            if last:
+                query = query.filter(db.tuple_(JournalEntry.created_at, JournalEntry.id) > db.tuple_(last.created_at, last.id))
+
+            entries = query.order_by(JournalEntry.created_at, JournalEntry.id).limit(chunk_size).all()
+            if not entries:
+                return
+
+            last = entries[-1]
+            yield JournalEntry.decrypt_entries(entries) if decrypt else entries
+            if len(entries) < chunk_size:
+                return
+
+    @staticmethod
+    def stream_export_ndjson(session_id, start_date=None, end_date=None):
+        """Yield the export as newline-delimited JSON, one entry per line."""
+        for chunk in JournalService.iter_export_chunks(session_id, start_date, end_date):
+            yield ''.join(json.dumps(entry.to_dict(), ensure_ascii=False) + '\n'
+                          for entry in chunk).encode()
+
+    @staticmethod
+    def stream_export_zip(session_id, start_date=None, end_date=None):
+        """Yield a zip archive holding the NDJSON export, compressed as it is produced."""
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('journal.ndjson', 'w', force_zip64=True) as member:
+                for data in JournalService.stream_export_ndjson(session_id, start_date, end_date):
+                    member.write(data)
+                    yield buffer.drain()
+        yield buffer.drain()
+
     @staticmethod
     def get_writing_streak(session_id):
-        """Calculate current writing streak."""
-        from datetime import datetime, timedelta
-
-        # Get entries from last 60 days
-        cutoff_date = datetime.utcnow() - timedelta(days=60)
-        entries = JournalEntry.query.filter_by(session_id=session_id)\
-            .filter(JournalEntry.created_at >= cutoff_date)\
-            .order_by(JournalEntry.created_at.desc())\
-            .all()
-
-        if not entries:
-            return 0
-
-        # Calculate streak
-        streak = 0
-        current_date = datetime.utcnow().date()
-        entry_dates = {entry.created_at.date() for entry in entries}
-
-        while current_date in entry_dates or (current_date - timedelta(days=1)) in entry_dates:
-            if current_date in entry_dates:
-                streak += 1
-            current_date -= timedelta(days=1)
-
-        return streak
+        """Get current writing streak from the session's day bitmap."""
+        return ActivityDays.get_current_streak(session_id, 'journal')
+
+
+class _StreamBuffer:
+    """Write-only file object that hands zipfile's output back in pieces.
+
+    Having no seek() makes zipfile write a streamable archive (data descriptors).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
@@ -1,27 +1,82 @@
 import json
 import os
+import threading
 from datetime import datetime, timedelta
-from models import db, MicroPlanProgress
+from types import MappingProxyType
+from flask import current_app
+from models import db, MicroPlanProgress, MicroPlanFunnel
+from services.event_bus import EventBus
+from sqlalchemy.exc import IntegrityError
 
-class MicroPlanService:
-    def __init__(self):
-        self.plans_data = self._load_plans_data()
+PLANS_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'micro_plans.json')
+
+class PlanCatalog:
+    """Immutable snapshot of micro_plans.json with per-plan task lookups precomputed.
+
+    Plan dicts are shared by every request and must be treated as read-only.
+    """
+    __slots__ = ('mtime', 'plans', 'total_tasks', 'day_task_ids', 'by_persona')
+
+    def __init__(self, mtime, plans):
+        by_persona = {}
+        for plan_id, plan in plans.items():
+            by_persona.setdefault(plan.get('target_audience'), {})[plan_id] = plan
+
+        self.mtime = mtime
+        self.plans = MappingProxyType(plans)
+        self.day_task_ids = MappingProxyType({
+            plan_id: MappingProxyType({
+                int(day): frozenset(task['id'] for task in day_data.get('tasks', []))
+                for day, day_data in plan['days'].items()
+            })
+            for plan_id, plan in plans.items()
+        })
+        self.total_tasks = MappingProxyType({
+            plan_id: sum(len(task_ids) for task_ids in days.values()) for plan_id, days in self.day_task_ids.items()
+        })
+        self.by_persona = MappingProxyType({persona: MappingProxyType(group) for persona, group in by_persona.items()})
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_funnel_refresh_lock = threading.Lock()
+
+def get_plan_catalog():
+    """Get the process-wide plan catalog, reloading it when micro_plans.json changes on disk."""
+    global _catalog
 
-    def _load_plans_data(self):
-        """Load micro-plans data from JSON file."""
-        plans_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'micro_plans.json')
-        with open(plans_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    catalog = _catalog
+    mtime = os.stat(PLANS_FILE).st_mtime_ns
+    if catalog is not None and catalog.mtime == mtime:
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is None or _catalog.mtime != mtime:
+            try:
+                with open(PLANS_FILE, 'r', encoding='utf-8') as f:
+                    _catalog = PlanCatalog(mtime, json.load(f))
+            except ValueError as e:
+                # A half-written file keeps the previous plans until the file changes again
+                if _catalog is None:
+                    raise
+                print(f"Failed to reload micro-plans: {e}")
+                _catalog = PlanCatalog(mtime, dict(_catalog.plans))
+        return _catalog
+
+class MicroPlanService:
+    @property
+    def plans_data(self):
+        return get_plan_catalog().plans
 
     def get_available_plans(self, persona=None):
         """Get all available micro-plans, optionally filtered by persona."""
+        catalog = get_plan_catalog()
         if persona:
-            return {k: v for k, v in self.plans_data.items() if v.get('target_audience') == persona}
-        return self.plans_data
+            return catalog.by_persona.get(persona, MappingProxyType({}))
+        return catalog.plans
 
     def get_plan_details(self, plan_id):
         """Get detailed information about a specific plan."""
-        return self.plans_data.get(plan_id)
+        return get_plan_catalog().plans.get(plan_id)
 
     def enroll_user(self, session_id, plan_id):
         """Enroll a user in a micro-plan."""
@@ -36,13 +91,14 @@ class MicroPlanService:
         if not progress:
             return None
 
-        plan_data = self.get_plan_details(plan_id)
+        catalog = get_plan_catalog()
+        plan_data = catalog.plans.get(plan_id)
         if not plan_data:
             return None
 
         # Calculate completion percentage
-        total_tasks = sum(len(day_data.get('tasks', [])) for day_data in plan_data['days'].values())
-        completed_tasks = sum(len(progress.get_completed_tasks_for_day(day)) for day in range(1, progress.current_day + 1))
+        total_tasks = catalog.total_tasks[plan_id]
+        completed_tasks = progress.completed_count
 
         return {
             'progress': progress,
@@ -54,40 +110,61 @@ class MicroPlanService:
 
     def mark_task_complete(self, session_id, plan_id, day, task_id):
         """Mark a task as completed."""
-        progress = MicroPlanProgress.get_user_progress(session_id, plan_id)
-        if not progress:
-            raise ValueError("User not enrolled in this plan")
+        return bool(self.mark_tasks_complete(session_id, plan_id, [(day, task_id)]))
 
-        if progress.is_completed:
-            raise ValueError("Plan already completed")
+    def mark_tasks_complete(self, session_id, plan_id, tasks):
+        """Mark several (day, task_id) pairs as completed in one transaction.
 
-        # Validate day and task
-        plan_data = self.get_plan_details(plan_id)
-        if str(day) not in plan_data['days']:
-            raise ValueError(f"Invalid day {day} for plan {plan_id}")
+        All pairs are validated before anything is written. Returns the number of
+        tasks that were newly completed. If a concurrent request completes some of
+        them first, the rest are retried once; IntegrityError is raised if that
+        conflicts too.
+        """
+        # Validate days and tasks
+        catalog = get_plan_catalog()
+        day_task_ids = catalog.day_task_ids.get(plan_id)
+        if day_task_ids is None:
+            raise ValueError(f"Plan {plan_id} not found")
+        for day, task_id in tasks:
+            if day not in day_task_ids:
+                raise ValueError(f"Invalid day {day} for plan {plan_id}")
+            if task_id not in day_task_ids[day]:
+                raise ValueError(f"Invalid task {task_id} for day {day}")
 
-        day_tasks = plan_data['days'][str(day)]['tasks']
-        task_ids = [task['id'] for task in day_tasks]
-        if task_id not in task_ids:
-            raise ValueError(f"Invalid task {task_id} for day {day}")
+        for attempt in range(2):
+            progress = MicroPlanProgress.get_user_progress(session_id, plan_id)
+            if not progress:
+                raise ValueError("User not enrolled in this plan")
 
-        # Mark task complete
-        if progress.mark_task_complete(day, task_id):
-            db.session.commit()
+            if progress.is_completed:
+                raise ValueError("Plan already completed")
 
-            # Check if day is complete and advance if needed
-            completed_tasks = progress.get_completed_tasks_for_day(day)
-            if len(completed_tasks) == len(task_ids) and day == progress.current_day:
-                progress.advance_day()
-                db.session.commit()
+            try:
+                new = progress.mark_tasks_complete(tasks)
+                if not new:
+                    return 0
+
+                # Advance past every day that is now complete, then check if the plan is complete
+                completed = progress.get_completed_tasks()
+                duration_days = catalog.plans[plan_id]['duration_days']
+                while progress.current_day <= duration_days and \
+                        day_task_ids.get(progress.current_day, frozenset()).issubset(completed.get(progress.current_day, ())):
+                    progress.advance_day()
 
-                # Check if plan is complete
-                if progress.current_day > plan_data['duration_days']:
+                plan_completed = progress.current_day > duration_days
+                if plan_completed:
                     progress.complete_plan()
-                    db.session.commit()
+                db.session.commit()
+                break
+            except IntegrityError:
+                # A concurrent request completed one of these tasks first; the retry skips it
+                db.session.rollback()
+                if attempt:
+                    raise
 
-            return True
-        return False
+        if plan_completed:
+            EventBus.publish(session_id, 'plan_completed', {'plan_id': plan_id})
+        return len(new)
 
     def get_user_active_plans(self, session_id):
         """Get all active (not completed) plans for a user."""
@@ -134,14 +211,13 @@ class MicroPlanService:
             return {'current_streak': 0, 'longest_streak': 0}
 
         # Calculate streaks based on completed days
-        completed = json.loads(progress.completed_tasks)
+        completed = progress.get_completed_tasks()
         current_streak = 0
         longest_streak = 0
         temp_streak = 0
 
         for day in range(1, progress.current_day + 1):
-            day_str = str(day)
-            if day_str in completed and len(completed[day_str]) > 0:
+            if completed.get(day):
                 temp_streak += 1
                 current_streak = temp_streak
                 longest_streak = max(longest_streak, temp_streak)
@@ -152,3 +228,51 @@ class MicroPlanService:
             'current_streak': current_streak,
             'longest_streak': longest_streak
         }
+
+    def refresh_funnels(self):
+        """Recompute the stored drop-off funnels for every plan in the catalog."""
+        catalog = get_plan_catalog()
+        return MicroPlanFunnel.refresh({plan_id: plan['duration_days'] for plan_id, plan in catalog.plans.items()})
+
+    def get_funnels(self):
+        """Get per-plan, per-day funnels, rebuilding them once they are older than FUNNEL_REFRESH_INTERVAL."""
+        funnels = MicroPlanFunnel.get_funnels()
+        if self._funnels_stale(funnels):
+            self._refresh_stale_funnels(wait=not funnels)
+            funnels = MicroPlanFunnel.get_funnels()
+
+        catalog = get_plan_catalog()
+        result = []
+        for plan_id, days in funnels.items():
+            enrolled = days[0].reached
+            completed = days[-1].completed
+            result.append({
+                'plan_id': plan_id,
+                'name': catalog.plans.get(plan_id, {}).get('name', plan_id),
+                'enrolled': enrolled,
+                'completed': completed,
+                'completion_rate': round(completed / enrolled * 100, 1) if enrolled else 0,
+                'refreshed_at': days[0].refreshed_at.isoformat() if days[0].refreshed_at else None,
+                'days': [day.to_dict() for day in days]
+            })
+        return result
+
+    def _funnels_stale(self, funnels):
+        if not funnels:
+            return True
+        refreshed_at = next(iter(funnels.values()))[0].refreshed_at
+        max_age = timedelta(seconds=current_app.config['FUNNEL_REFRESH_INTERVAL'])
+        return refreshed_at is None or refreshed_at < datetime.utcnow() - max_age
+
+    def _refresh_stale_funnels(self, wait):
+        # One request per worker rebuilds; the rest keep serving the previous refresh
+        if not _funnel_refresh_lock.acquire(blocking=wait):
+            return
+        try:
+            if self._funnels_stale(MicroPlanFunnel.get_funnels()):
+                self.refresh_funnels()
+        except IntegrityError:
+            # Another worker rebuilt the funnels at the same time; its rows are just as fresh
+            db.session.rollback()
+        finally:
+            _funnel_refresh_lock.release()
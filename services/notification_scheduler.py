@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+from models import db
+
+NOTIFICATION_TYPES = ('nudge', 'mood_reminder')
+
+class NotificationScheduler:
+    """Background thread that pushes due nudges and mood reminders to connected sessions.
+
+    One pass every `interval` seconds covers each session with an open event stream,
+    however many tabs or reconnects it has, instead of every stream checking on its own.
+    """
+    _app = None
+    _interval = 60
+    _last_checked = {}  # session_id -> monotonic time of its last check
+    _lock = threading.Lock()
+    _thread = None
+    _pid = None
+
+    @classmethod
+    def init_app(cls, app):
+        """Remember the app whose context the scheduler thread runs in."""
+        cls._app = app
+        cls._interval = app.config['NOTIFICATION_CHECK_INTERVAL']
+
+    @classmethod
+    def check_session(cls, session_id, force=False):
+        """Publish a session's due notifications unless it was checked within the interval."""
+        from services.event_bus import EventBus
+
+        cls._ensure_started()
+
+        # Streams that don't handle notifications neither use up nor reset the interval
+        if not any(EventBus.has_subscribers(session_id, event_type) for event_type in NOTIFICATION_TYPES):
+            return
+
+        now = time.monotonic()
+        with cls._lock:
+            if not force and now - cls._last_checked.get(session_id, float('-inf')) < cls._interval:
+                return
+            cls._last_checked[session_id] = now
+
+        from services.wellness_tracker import WellnessTracker
+
+        WellnessTracker.publish_due_notifications(session_id)
+
+    @classmethod
+    def _ensure_started(cls):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive() and cls._pid == os.getpid():
+                return
+            cls._pid = os.getpid()
+            cls._thread = threading.Thread(target=cls._run, name='notification-scheduler', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def _run(cls):
+        from services.event_bus import EventBus
+
+        while True:
+            time.sleep(cls._interval)
+            sessions = set(EventBus.connected_sessions())
+            with cls._lock:
+                # Forget sessions whose streams have all closed
+                cls._last_checked = {sid: at for sid, at in cls._last_checked.items() if sid in sessions}
+
+            with cls._app.app_context():
+                for session_id in sessions:
+                    try:
+                        cls.check_session(session_id, force=True)
+                    except Exception:
+                        cls._app.logger.exception(f"Notification check failed for session {session_id}")
+                        db.session.rollback()
+                db.session.remove()
@@ -0,0 +1,130 @@
+from models import Conversation, JournalEntry, db
+from models.compression import pack_text, COMPRESSED_MARKER
+import time
+
+class StorageService:
+    @staticmethod
+    def get_text_storage():
+        """Get the bytes stored for conversation and journal text, per table."""
+        def stored_bytes(*columns):
+            sizes = [db.func.coalesce(db.func.length(db.cast(column, db.LargeBinary)), 0) for column in columns]
+            return db.session.query(db.func.sum(sum(sizes[1:], sizes[0]))).scalar() or 0
+
+        return {
+            'conversations': stored_bytes(Conversation.message, Conversation.response),
+            'journal_entries': stored_bytes(JournalEntry.title, JournalEntry.content)
+        }
+
+    @staticmethod
+    def measure_read_throughput(batch_size=500):
+        """Read back all conversation and journal text, returning rows/s per table."""
+        results = {}
+
+        started = time.monotonic()
+        rows = last_id = 0
+        while True:
+            batch = db.session.query(Conversation.id, Conversation.message, Conversation.response)\
+                .filter(Conversation.id > last_id).order_by(Conversation.id).limit(batch_size).all()
+            if not batch:
+                break
+            rows += len(batch)
+            last_id = batch[-1].id
+        elapsed = time.monotonic() - started
+        results['conversations'] = rows / elapsed if elapsed else 0
+
+        started = time.monotonic()
+        rows = last_id = 0
+        while True:
+            batch = JournalEntry.query.filter(JournalEntry.id > last_id).order_by(JournalEntry.id).limit(batch_size).all()
+            if not batch:
+                break
+            JournalEntry.decrypt_entries(batch)
+            rows += len(batch)
+            last_id = batch[-1].id
+            db.session.expunge_all()
+        elapsed = time.monotonic() - started
+        results['journal_entries'] = rows / elapsed if elapsed else 0
+
+        return results
+
+    @staticmethod
+    def recompress_conversations(batch_size=500, report=print):
+        """Rewrite conversations stored before compression, in id-ordered batches.
+
+        Only rows still holding plain text are read, and only those that shrink are
+        written, so the migration can be stopped and rerun at any point. Conversations
+        are only compressed on SQLite (see CompressedText), so elsewhere nothing is done.
+        """
+        if db.engine.dialect.name != 'sqlite':
+            report("Conversation compression is only supported on SQLite, skipping")
+            return 0, 0
+
+        started = time.monotonic()
+        scanned = rewritten = 0
+        last_id = 0
+        table = Conversation.__table__
+        plain = db.or_(db.func.typeof(table.c.message) == 'text', db.func.typeof(table.c.response) == 'text')
+        while True:
+            # Core select, so the values come back as stored rather than through CompressedText
+            batch = db.session.execute(
+                db.select(table.c.id, db.cast(table.c.message, db.LargeBinary), db.cast(table.c.response, db.LargeBinary))
+                .where(table.c.id > last_id).where(plain).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not batch:
+                break
+
+            for row_id, message, response in batch:
+                # Columns already compressed, or too short to shrink, are left alone
+                changes = {name: value.decode() for name, value in (('message', message), ('response', response))
+                           if not value.startswith(COMPRESSED_MARKER)
+                           and pack_text(value.decode()).startswith(COMPRESSED_MARKER)}
+                if changes:
+                    db.session.execute(db.update(Conversation).where(Conversation.id == row_id).values(**changes))
+                    rewritten += 1
+
+            scanned += len(batch)
+            last_id = batch[-1][0]
+            db.session.commit()
+
+            elapsed = time.monotonic() - started
+            report(f"{scanned} conversations scanned, {rewritten} compressed, "
+                   f"{scanned / elapsed if elapsed else 0:.1f} rows/s")
+
+        return scanned, rewritten
+
+    @staticmethod
+    def recompress_journal_entries(batch_size=500, report=print):
+        """Re-encrypt encrypted entries whose text was stored uncompressed, in id-ordered batches.
+
+        Unencrypted entries stay plain text, since the full-text index reads them directly.
+        Returns (scanned, rewritten, failed).
+        """
+        started = time.monotonic()
+        scanned = rewritten = failed = 0
+        last_id = 0
+        while True:
+            batch = JournalEntry.query.filter(JournalEntry.id > last_id)\
+                .filter(JournalEntry.is_encrypted.is_(True))\
+                .order_by(JournalEntry.id)\
+                .limit(batch_size)\
+                .all()
+            if not batch:
+                break
+
+            for entry in batch:
+                try:
+                    if entry.needs_compression():
+                        entry.reencrypt()
+                        rewritten += 1
+                except Exception as e:
+                    print(f"Recompression failed for journal entry {entry.id}: {e}")
+                    failed += 1
+            scanned += len(batch)
+            last_id = batch[-1].id
+            db.session.commit()
+
+            elapsed = time.monotonic() - started
+            report(f"{scanned} journal entries scanned, {rewritten} compressed, {failed} failed, "
+                   f"{scanned / elapsed if elapsed else 0:.1f} entries/s")
+
+        return scanned, rewritten, failed
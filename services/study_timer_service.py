@@ -1,100 +1,196 @@
-from models import StudySession, db
+from models import StudySession, ActiveStudyTimer, StudyPause, CacheVersion, db
+from services.event_bus import EventBus
+from services.cache import LRUCache, TTLCache, STATS_CACHE_TTL
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 import json
+import time
+
+# Active timers are cached per worker. Each session's timer has its own shared version,
+# named with this prefix; the check interval bounds how long another worker's start,
+# pause or stop can go unseen
+TIMER_CACHE_PREFIX = 'study_timer:'
+TIMER_CHECK_INTERVAL = 2  # Seconds
+TIMER_CLOCK_SLACK = timedelta(seconds=5)  # Overlap between checks, for commits landing late or clock skew
+# Stopping a timer prunes versions older than this; a worker whose last check is older reloads every timer
+TIMER_VERSION_RETENTION = timedelta(minutes=10)
+_NOT_LOADED = object()
 
 class StudyTimerService:
+    _stats_cache = TTLCache(STATS_CACHE_TTL, maxsize=4096)  # (session_id, days) -> stats
+    _heatmap_cache = TTLCache(STATS_CACHE_TTL, maxsize=4096)  # (session_id, days) -> heatmap
+    _active_timers = LRUCache(maxsize=4096)  # session_id -> TimerSnapshot, or None when idle
+    _timers_synced_at = None  # Wall-clock time of the last version check
+    _timers_checked_at = 0.0
+
     @staticmethod
     def start_session(session_id, subject=None, mood_before=None):
         """Start a new study session."""
         # Check if there's an active session
-        active_session = StudyTimerService.get_active_session(session_id)
-        if active_session:
+        if StudyTimerService.get_active_timer(session_id):
             return None, "An active study session already exists"
 
+        now = datetime.utcnow()
         session = StudySession(
             session_id=session_id,
             duration=0,  # Will be updated when stopped
             subject=subject,
+            start_time=now,
             mood_before=mood_before
         )
+        session.completed = False
 
         db.session.add(session)
-        db.session.commit()
+        db.session.flush()
+        db.session.add(ActiveStudyTimer(session_id=session_id, study_session_id=session.id, started_at=now))
+        CacheVersion.increment(f'{TIMER_CACHE_PREFIX}{session_id}')
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request started a timer first; the primary key allows one per user
+            db.session.rollback()
+            return None, "An active study session already exists"
+
+        StudyTimerService.invalidate_study_stats(session_id)
+        StudyTimerService._timer_changed(session_id)
 
         return session, "Study session started"
 
     @staticmethod
     def stop_session(session_id, mood_after=None, productivity_rating=None, notes=None):
         """Stop the active study session."""
-        active_session = StudyTimerService.get_active_session(session_id)
-        if not active_session:
+        timer = ActiveStudyTimer.query.get(session_id)
+        if not timer:
             return None, "No active study session found"
 
-        # Calculate duration
+        active_session = StudySession.query.get(timer.study_session_id)
         end_time = datetime.utcnow()
-        duration = int((end_time - active_session.start_time).total_seconds())
+        duration, paused = timer.finish(end_time)
 
         active_session.end_time = end_time
         active_session.duration = duration
+        active_session.break_duration = paused
         active_session.mood_after = mood_after
         active_session.productivity_rating = productivity_rating
         active_session.notes = notes
         active_session.completed = True
 
+        CacheVersion.increment(f'{TIMER_CACHE_PREFIX}{session_id}')
+        CacheVersion.prune(TIMER_CACHE_PREFIX, end_time - TIMER_VERSION_RETENTION)
         db.session.commit()
+        StudyTimerService._timer_changed(session_id)
+        EventBus.publish(session_id, 'study_completed', {
+            'study_session_id': active_session.id,
+            'duration': duration
+        })
+        # After the event, whose handlers update the streak the stats include
+        StudyTimerService.invalidate_study_stats(session_id)
+        StudyTimerService.invalidate_study_heatmap(session_id)
 
         return active_session, f"Study session completed ({duration} seconds)"
 
     @staticmethod
     def pause_session(session_id):
         """Pause the active study session."""
-        active_session = StudyTimerService.get_active_session(session_id)
-        if not active_session:
-            return None, "No active study session found"
+        return StudyTimerService._change_timer(session_id, 'pause', "Study session paused")
 
-        # For now, we'll just mark it as completed with current duration
-        # In a more advanced implementation, you could track pause/resume times
-        end_time = datetime.utcnow()
-        duration = int((end_time - active_session.start_time).total_seconds())
+    @staticmethod
+    def resume_session(session_id):
+        """Resume the paused study session."""
+        return StudyTimerService._change_timer(session_id, 'resume', "Study session resumed")
 
-        active_session.end_time = end_time
-        active_session.duration = duration
-        active_session.completed = False  # Mark as incomplete/paused
+    @staticmethod
+    def _change_timer(session_id, action, message):
+        """Apply a pause or resume to the active timer if its state allows it."""
+        timer = ActiveStudyTimer.query.get(session_id)
+        if not timer:
+            return None, "No active study session found"
+        if not timer.can(action):
+            return None, f"Study session is {timer.state}"
 
+        getattr(timer, action)(datetime.utcnow())
+        CacheVersion.increment(f'{TIMER_CACHE_PREFIX}{session_id}')
         db.session.commit()
+        StudyTimerService._timer_changed(session_id)
+
+        return StudySession.query.get(timer.study_session_id), message
 
-        return active_session, "Study session paused"
+    @staticmethod
+    def get_active_timer(session_id):
+        """Get the session's active timer from this worker's registry, loading it on a miss.
+
+        Returns a TimerSnapshot, or None when no session is being timed. At most every
+        TIMER_CHECK_INTERVAL seconds, one query finds the sessions whose timer another
+        worker has changed and drops just those entries, so status polls rarely touch
+        the database.
+        """
+        now = time.monotonic()
+        if now - StudyTimerService._timers_checked_at >= TIMER_CHECK_INTERVAL:
+            # Drop only the sessions whose timer changed since the last check
+            synced_at = datetime.utcnow()
+            last_synced_at = StudyTimerService._timers_synced_at
+            if last_synced_at is not None and synced_at - last_synced_at < TIMER_VERSION_RETENTION - TIMER_CLOCK_SLACK:
+                for name in CacheVersion.get_changed_since(TIMER_CACHE_PREFIX, last_synced_at - TIMER_CLOCK_SLACK):
+                    StudyTimerService._active_timers.pop(name[len(TIMER_CACHE_PREFIX):])
+            else:
+                StudyTimerService._active_timers.clear()
+            StudyTimerService._timers_synced_at = synced_at
+            StudyTimerService._timers_checked_at = now
+
+        snapshot = StudyTimerService._active_timers.get(session_id, _NOT_LOADED)
+        if snapshot is _NOT_LOADED:
+            snapshot = ActiveStudyTimer.get_snapshot(session_id)
+            StudyTimerService._active_timers.set(session_id, snapshot)
+        return snapshot
+
+    @staticmethod
+    def _timer_changed(session_id):
+        """Drop this worker's copy of a timer whose change, and version, were just committed, then push the new state."""
+        StudyTimerService._active_timers.pop(session_id)
+        StudyTimerService.publish_status(session_id)
 
     @staticmethod
     def get_active_session(session_id):
         """Get the currently active study session."""
-        # An active session is one that doesn't have an end_time set
-        return StudySession.query.filter_by(session_id=session_id, end_time=None).first()
+        snapshot = StudyTimerService.get_active_timer(session_id)
+        return StudySession.query.get(snapshot.study_session_id) if snapshot else None
 
     @staticmethod
     def get_session_status(session_id):
         """Get the status of the current study session."""
-        active_session = StudyTimerService.get_active_session(session_id)
-        if not active_session:
+        snapshot = StudyTimerService.get_active_timer(session_id)
+        if not snapshot:
             return {'active': False}
 
-        elapsed_time = int((datetime.utcnow() - active_session.start_time).total_seconds())
+        elapsed_time = snapshot.elapsed_seconds()
 
         return {
             'active': True,
-            'session_id': active_session.id,
-            'subject': active_session.subject,
-            'start_time': active_session.start_time.isoformat(),
+            'session_id': snapshot.study_session_id,
+            'state': snapshot.state,
+            'subject': snapshot.subject,
+            'start_time': snapshot.started_at.isoformat(),
             'elapsed_seconds': elapsed_time,
             'elapsed_formatted': StudyTimerService._format_duration(elapsed_time),
-            'mood_before': active_session.mood_before
+            'mood_before': snapshot.mood_before
         }
 
+    @staticmethod
+    def publish_status(session_id):
+        """Push the current timer state to connected clients."""
+        if EventBus.has_subscribers(session_id, 'timer'):
+            EventBus.publish(session_id, 'timer', StudyTimerService.get_session_status(session_id))
+
     @staticmethod
     def get_user_sessions(session_id, limit=20, offset=0):
         """Get study sessions for a user."""
         return StudySession.get_user_sessions(session_id, limit, offset)
 
+    @staticmethod
+    def get_user_sessions_page(session_id, limit=20, cursor=None, offset=0):
+        """Get a page of study sessions and the cursor for the next page."""
+        return StudySession.get_user_sessions_page(session_id, limit, cursor, offset)
+
     @staticmethod
     def get_session_by_id(session_id, user_session_id):
         """Get a specific study session."""
@@ -112,6 +208,8 @@ class StudyTimerService:
                 setattr(session, key, value)
 
         db.session.commit()
+        StudyTimerService.invalidate_study_stats(user_session_id)
+        StudyTimerService.invalidate_study_heatmap(user_session_id)
         return session
 
     @staticmethod
@@ -119,15 +217,43 @@ class StudyTimerService:
         """Delete a study session."""
         session = StudySession.query.filter_by(id=session_id, session_id=user_session_id).first()
         if session:
+            timers = ActiveStudyTimer.query.filter_by(study_session_id=session.id).delete(synchronize_session=False)
+            StudyPause.query.filter_by(study_session_id=session.id).delete(synchronize_session=False)
             db.session.delete(session)
+            if timers:
+                CacheVersion.increment(f'{TIMER_CACHE_PREFIX}{user_session_id}')
             db.session.commit()
+            StudyTimerService.invalidate_study_stats(user_session_id)
+            StudyTimerService.invalidate_study_heatmap(user_session_id)
+            if timers:
+                StudyTimerService._timer_changed(user_session_id)
             return True
         return False
 
     @staticmethod
     def get_study_stats(session_id, days=30):
-        """Get comprehensive study statistics."""
-        return StudySession.get_study_stats(session_id, days)
+        """Get comprehensive study statistics, cached per (session, days) until the next study write.
+
+        Stats, insights and goals all read from here, so a page load computes them once.
+        """
+        return StudyTimerService._stats_cache.get_or_compute(
+            session_id, days, lambda: StudySession.get_study_stats(session_id, days))
+
+    @staticmethod
+    def invalidate_study_stats(session_id):
+        """Drop a session's cached stats after a study session write."""
+        StudyTimerService._stats_cache.invalidate(session_id)
+
+    @staticmethod
+    def get_study_heatmap(session_id, days=90):
+        """Get the hour-by-weekday heatmap and trends, cached until the next finished session."""
+        return StudyTimerService._heatmap_cache.get_or_compute(
+            session_id, days, lambda: StudySession.get_study_heatmap(session_id, days))
+
+    @staticmethod
+    def invalidate_study_heatmap(session_id):
+        """Drop a session's cached heatmap after a session is finished, edited or deleted."""
+        StudyTimerService._heatmap_cache.invalidate(session_id)
 
     @staticmethod
     def get_sessions_by_subject(session_id, subject):
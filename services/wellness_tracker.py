@@ -1,7 +1,13 @@
-from models import db, UserSession
-from datetime import datetime, timedelta
+from models import db, UserSession, ActivityDays
+from services.event_bus import EventBus
+from datetime import datetime, timedelta, time
 import json
 
+MOOD_REMINDER_START_HOUR = 9
+MOOD_REMINDER_END_HOUR = 21
+MOOD_REMINDER_INTERVAL = timedelta(hours=4)
+MOOD_REMINDERS_DISABLED = datetime(9999, 12, 31)  # Stored when a user has turned reminders off
+
 class WellnessTracker:
     @staticmethod
     def log_mood(session_id, mood):
@@ -9,7 +15,9 @@ class WellnessTracker:
         if session:
             session.add_mood_entry(mood)
             session.update_activity()
+            WellnessTracker._update_next_mood_reminder(session)
             db.session.commit()
+            EventBus.publish(session_id, 'mood_logged', {'mood': mood})
             return True
         return False
 
@@ -48,34 +56,20 @@ class WellnessTracker:
 
     @staticmethod
     def should_send_mood_reminder(session_id):
-        """Check if user should receive a mood reminder today."""
-        session = UserSession.query.filter_by(session_id=session_id).first()
-        if not session:
+        """Check if user should receive a mood reminder now."""
+        row = db.session.query(UserSession.next_mood_reminder_at).filter_by(session_id=session_id).first()
+        if not row:
             return False
 
-        # Check if user has mood reminders enabled
-        reminders_enabled = session.get_preference('mood_reminders_enabled', True)
-        if not reminders_enabled:
-            return False
-
-        # Check if user has logged mood today
-        today = datetime.utcnow().date()
-        mood_history = session.get_mood_history()
-        today_entries = [entry for entry in mood_history if datetime.fromisoformat(entry['date']).date() == today]
+        next_reminder_at = row[0]
+        if next_reminder_at is None:
+            # Sessions created before the column existed are computed once on first check
+            session = UserSession.query.filter_by(session_id=session_id).first()
+            next_reminder_at = WellnessTracker._update_next_mood_reminder(session)
+            db.session.commit()
 
-        # Send reminder if no mood logged today and it's between 9 AM and 9 PM
         now = datetime.utcnow()
-        if not today_entries and 9 <= now.hour <= 21:
-            # Check last reminder time to avoid spamming
-            last_reminder = session.get_preference('last_mood_reminder')
-            if last_reminder:
-                last_reminder_time = datetime.fromisoformat(last_reminder)
-                # Don't send reminder more than once every 4 hours
-                if (now - last_reminder_time).total_seconds() < 14400:  # 4 hours
-                    return False
-
-            return True
-        return False
+        return next_reminder_at <= now and MOOD_REMINDER_START_HOUR <= now.hour <= MOOD_REMINDER_END_HOUR
 
     @staticmethod
     def mark_mood_reminder_sent(session_id):
@@ -83,36 +77,68 @@ class WellnessTracker:
         session = UserSession.query.filter_by(session_id=session_id).first()
         if session:
             session.set_preference('last_mood_reminder', datetime.utcnow().isoformat())
+            WellnessTracker._update_next_mood_reminder(session)
             db.session.commit()
 
     @staticmethod
-    def get_mood_streak(session_id):
-        """Calculate current mood logging streak in days."""
-        session = UserSession.query.filter_by(session_id=session_id).first()
-        if not session:
-            return 0
+    def get_sessions_due_for_mood_reminder(now=None, limit=500):
+        """Get ids of sessions whose next mood reminder is due, for batch reminder jobs."""
+        now = now or datetime.utcnow()
+        if not MOOD_REMINDER_START_HOUR <= now.hour <= MOOD_REMINDER_END_HOUR:
+            return []
 
-        mood_history = session.get_mood_history()
-        if not mood_history:
-            return 0
+        # Sessions created before the column existed are computed here, a batch per call
+        unscheduled = UserSession.query.filter(UserSession.next_mood_reminder_at.is_(None)).limit(limit).all()
+        if unscheduled:
+            for session in unscheduled:
+                WellnessTracker._update_next_mood_reminder(session, now)
+            db.session.commit()
 
-        # Sort by date descending
-        sorted_history = sorted(mood_history, key=lambda x: x['date'], reverse=True)
+        rows = db.session.query(UserSession.session_id)\
+            .filter(UserSession.next_mood_reminder_at <= now)\
+            .order_by(UserSession.next_mood_reminder_at)\
+            .limit(limit)\
+            .all()
+        return [row[0] for row in rows]
 
-        streak = 0
-        current_date = datetime.utcnow().date()
+    @staticmethod
+    def _update_next_mood_reminder(session, now=None):
+        """Recompute and store when the session is next due a mood reminder."""
+        session.next_mood_reminder_at = WellnessTracker._compute_next_mood_reminder(session, now)
+        return session.next_mood_reminder_at
 
-        for entry in sorted_history:
-            entry_date = datetime.fromisoformat(entry['date']).date()
+    @staticmethod
+    def _compute_next_mood_reminder(session, now=None):
+        """Compute the next reminder time.
 
-            # If this entry is for today or yesterday (continuing streak)
-            if entry_date == current_date or entry_date == current_date - timedelta(days=streak):
-                streak += 1
-                current_date = entry_date
-            else:
-                break
+        Reminders go out between 9 AM and 9 PM, only on days without a logged mood,
+        and at most once every 4 hours.
+        """
+        if not session.get_preference('mood_reminders_enabled', True):
+            return MOOD_REMINDERS_DISABLED
+
+        now = now or datetime.utcnow()
+        day = now.date()
+        last_mood = session.get_last_mood_time()
+        if last_mood and last_mood.date() >= day:
+            day += timedelta(days=1)
 
-        return streak
+        next_reminder = datetime.combine(day, time(MOOD_REMINDER_START_HOUR))
+        last_reminder = session.get_preference('last_mood_reminder')
+        if last_reminder:
+            next_reminder = max(next_reminder, datetime.fromisoformat(last_reminder) + MOOD_REMINDER_INTERVAL)
+
+        if next_reminder.hour > MOOD_REMINDER_END_HOUR:
+            next_reminder = datetime.combine(next_reminder.date() + timedelta(days=1), time(MOOD_REMINDER_START_HOUR))
+        elif next_reminder.hour < MOOD_REMINDER_START_HOUR:
+            next_reminder = datetime.combine(next_reminder.date(), time(MOOD_REMINDER_START_HOUR))
+
+        return next_reminder
+
+    @staticmethod
+    def get_mood_streak(session_id):
+        """Get current mood logging streak in days from the session's day bitmap."""
+        return ActivityDays.get_current_streak(session_id, 'mood')
 
     @staticmethod
     def get_weekly_mood_summary(session_id):
@@ -216,3 +242,23 @@ class WellnessTracker:
         session.set_preference('scheduled_nudges', nudges)
         db.session.commit()
         return True
+
+    @staticmethod
+    def publish_due_notifications(session_id):
+        """Push due nudges and mood reminders to connected clients that handle them.
+
+        Each is marked sent only when a client listens for its type; otherwise it stays
+        pending for /api/nudges/pending or a later stream.
+        """
+        if EventBus.has_subscribers(session_id, 'nudge'):
+            for nudge in WellnessTracker.get_pending_nudges(session_id):
+                WellnessTracker.mark_nudge_sent(session_id, nudge['id'])
+                EventBus.publish(session_id, 'nudge', nudge)
+
+        if EventBus.has_subscribers(session_id, 'mood_reminder') and \
+                WellnessTracker.should_send_mood_reminder(session_id):
+            WellnessTracker.mark_mood_reminder_sent(session_id)
+            EventBus.publish(session_id, 'mood_reminder', {
+                'message': 'How are you feeling today? Take a moment to log your mood.',
+                'type': 'mood_reminder'
+            })
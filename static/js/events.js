@@ -0,0 +1,46 @@
+// Events.js - Server-pushed nudges, reminders, badge awards and timer state
+
+const WellnessEvents = (function () {
+	const handlers = {};
+	let source = null;
+	let pending = false;
+
+	function connect() {
+		if (!window.EventSource) return;
+		if (source) source.close();
+
+		// The server only sends, and only marks as delivered, the event types handled here
+		const types = Object.keys(handlers);
+		source = new EventSource(
+			"/api/events/stream?types=" + encodeURIComponent(types.join(",")),
+		);
+		types.forEach(listen);
+	}
+
+	function listen(type) {
+		source.addEventListener(type, function (e) {
+			const data = JSON.parse(e.data);
+			handlers[type].forEach((handler) => handler(data));
+		});
+	}
+
+	function on(type, handler) {
+		if (!handlers[type]) {
+			handlers[type] = [];
+			// Connect once the page has registered its handlers, reconnecting for types added later
+			if (!pending) {
+				pending = true;
+				setTimeout(function () {
+					pending = false;
+					connect();
+				}, 0);
+			}
+		}
+		handlers[type].push(handler);
+	}
+
+	return {
+		supported: !!window.EventSource,
+		on: on,
+	};
+})();
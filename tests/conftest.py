@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+from contextlib import contextmanager
+from cryptography.fernet import Fernet
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """One app and SQLite database for the whole run; tests use their own session ids."""
+    tmp = tmp_path_factory.mktemp('app')
+    Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp / "test.db"}'
+    Config.SESSION_FILE_DIR = str(tmp / 'sessions')
+    Config.BADGE_EVALUATION_MODE = 'sync'
+    Config.JOURNAL_MASTER_KEY = Fernet.generate_key().decode()
+
+    from app import create_app
+    from services.badge_service import BadgeService
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        BadgeService.initialize_default_badges()
+    return app
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager yielding the list of SQL statements executed inside it."""
+    from models import db
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, Badge, BadgeEarnCount, UserBadge, UserSession
+from models.schema import upgrade_schema
+from services.wellness_tracker import WellnessTracker
+
+def _badge_id(name):
+    return next(badge.id for badge in Badge.get_catalog().badges if badge.name == name)
+
+def _new_session():
+    session_id = str(uuid.uuid4())
+    db.session.add(UserSession(session_id=session_id))
+    db.session.commit()
+    return session_id
+
+def _earned_counts():
+    return dict(db.session.query(UserBadge.badge_id, db.func.count(UserBadge.id))
+                .filter(UserBadge.is_earned.is_(True)).group_by(UserBadge.badge_id))
+
+def test_upgrade_keeps_earned_awards_over_progress_rows(app):
+    with app.app_context():
+        first_mood, explorer, first_chat = _badge_id('First Mood'), _badge_id('Mood Explorer'), _badge_id('First Chat')
+        session_id = _new_session()
+
+        # Rows as the old badge engine left them: a progress row written before the award,
+        # a progress row for a badge never earned, and a badge awarded twice
+        db.session.execute(text('DROP INDEX uq_user_badges_session_badge'))
+        db.session.execute(db.insert(UserBadge), [
+            {'session_id': session_id, 'badge_id': first_mood, 'progress_value': 0, 'is_earned': False},
+            {'session_id': session_id, 'badge_id': first_mood, 'progress_value': 1, 'is_earned': True},
+            {'session_id': session_id, 'badge_id': explorer, 'progress_value': 12, 'is_earned': False},
+            {'session_id': session_id, 'badge_id': first_chat, 'progress_value': 1, 'is_earned': True},
+            {'session_id': session_id, 'badge_id': first_chat, 'progress_value': 1, 'is_earned': True},
+        ])
+        db.session.commit()
+
+        upgrade_schema()
+
+        rows = UserBadge.query.filter_by(session_id=session_id).order_by(UserBadge.badge_id).all()
+        assert sorted((row.badge_id, row.is_earned) for row in rows) == sorted([(first_mood, True), (first_chat, True)])
+        assert 'uq_user_badges_session_badge' in {index['name'] for index in inspect(db.engine).get_indexes('user_badges')}
+        assert BadgeEarnCount.get_counts() == _earned_counts()
+
+def test_award_turns_a_leftover_progress_row_into_the_award(app):
+    with app.test_request_context():
+        first_mood = _badge_id('First Mood')
+        session_id = _new_session()
+        db.session.add(UserBadge(session_id=session_id, badge_id=first_mood, progress_value=0))
+        db.session.flush()
+        UserBadge.query.filter_by(session_id=session_id).update({'is_earned': False})
+        db.session.commit()
+        counts_before = BadgeEarnCount.get_counts().get(first_mood, 0)
+
+        WellnessTracker.log_mood(session_id, 6)
+
+        rows = UserBadge.query.filter_by(session_id=session_id, badge_id=first_mood).all()
+        assert [(row.is_earned, row.progress_value) for row in rows] == [(True, 1)]
+        assert rows[0].earned_at <= datetime.utcnow()
+        assert BadgeEarnCount.get_counts()[first_mood] == counts_before + 1
+
+def test_new_earn_counts_table_starts_from_existing_awards(app):
+    with app.app_context():
+        BadgeEarnCount.query.delete()
+        db.session.commit()
+
+        upgrade_schema({'badge_earn_counts'})
+
+        assert BadgeEarnCount.get_counts() == _earned_counts()
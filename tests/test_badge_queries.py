@@ -0,0 +1,63 @@
+import uuid
+from models import db, UserSession, UserBadge
+from services.badge_service import BadgeService
+from services.wellness_tracker import WellnessTracker
+
+def _session_with_moods(count):
+    session_id = str(uuid.uuid4())
+    db.session.add(UserSession(session_id=session_id))
+    db.session.commit()
+    for i in range(count):
+        WellnessTracker.log_mood(session_id, 5 + i % 3)
+    return session_id
+
+def test_badge_check_query_count_does_not_grow_with_history(app, count_queries):
+    with app.test_request_context():
+        small = _session_with_moods(1)
+        large = _session_with_moods(30)
+
+        counts = []
+        for session_id in (small, large):
+            with count_queries() as statements:
+                assert BadgeService.check_and_award_badges(session_id) == []
+            counts.append(len(statements))
+
+    # Counters, day bitmaps and earned badge ids: one query each, however much history there is
+    assert counts == [3, 3]
+
+def test_badge_award_query_count(app, count_queries):
+    with app.test_request_context():
+        session_id = _session_with_moods(50)
+        # Forget the awards so the next check hands out First Mood and Mood Explorer again
+        UserBadge.query.filter_by(session_id=session_id).delete()
+        db.session.commit()
+
+        with count_queries() as statements:
+            earned = BadgeService.check_and_award_badges(session_id)
+
+    assert len(earned) == 2
+    # The three reads, then one insert and one earn-count update per new badge
+    assert len(statements) == 3 + 2 * len(earned)
+
+def _progress_query_count(app, count_queries, session_id):
+    with app.test_request_context():
+        BadgeService.get_all_badges()  # Load the badge catalog outside the count
+        with count_queries() as statements:
+            progress = BadgeService.get_user_badge_progress(session_id)
+    assert len(progress) == len(BadgeService.get_all_badges())
+    return len(statements)
+
+def test_badge_progress_query_count_does_not_grow(app, count_queries):
+    with app.test_request_context():
+        small = _session_with_moods(1)
+        large = _session_with_moods(30)
+
+    counts = [_progress_query_count(app, count_queries, session_id) for session_id in (small, large)]
+
+    with app.app_context():
+        for i in range(20):
+            BadgeService.create_badge(f'Query Count {i}', 'Only here to grow the catalog', 'chat', 'count', 1000 + i)
+    counts.append(_progress_query_count(app, count_queries, large))
+
+    # Earned badges, then the counters aggregate, the mood history and the day bitmaps
+    assert counts == [4, 4, 4]
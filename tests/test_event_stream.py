@@ -0,0 +1,41 @@
+import uuid
+from datetime import datetime, timedelta
+from models import db, UserSession
+from services.event_bus import EventBus
+from services.wellness_tracker import WellnessTracker
+
+def _session_with_due_nudge():
+    session_id = str(uuid.uuid4())
+    db.session.add(UserSession(session_id=session_id))
+    db.session.commit()
+    WellnessTracker.schedule_nudge(session_id, 'break', datetime.utcnow() - timedelta(minutes=1))
+    return session_id
+
+def test_due_nudges_wait_for_a_stream_that_handles_them(app):
+    with app.app_context():
+        session_id = _session_with_due_nudge()
+
+        listener = EventBus.subscribe(session_id, {'badge_awarded', 'timer'})
+        try:
+            WellnessTracker.publish_due_notifications(session_id)
+            assert listener.empty()
+            assert len(WellnessTracker.get_pending_nudges(session_id)) == 1
+        finally:
+            EventBus.unsubscribe(session_id, listener)
+
+        listener = EventBus.subscribe(session_id, {'nudge'})
+        try:
+            WellnessTracker.publish_due_notifications(session_id)
+            assert listener.get_nowait()['type'] == 'nudge'
+            assert WellnessTracker.get_pending_nudges(session_id) == []
+        finally:
+            EventBus.unsubscribe(session_id, listener)
+
+def test_stream_without_types_gets_every_event(app):
+    session_id = str(uuid.uuid4())
+    listener = EventBus.subscribe(session_id)
+    try:
+        assert EventBus.publish(session_id, 'nudge', {}) == 1
+        assert EventBus.publish(session_id, 'timer', {}) == 1
+    finally:
+        EventBus.unsubscribe(session_id, listener)
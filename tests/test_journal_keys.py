@@ -0,0 +1,33 @@
+import uuid
+from cryptography.fernet import Fernet
+from models import db, UserSession, JournalKey
+from services.journal_crypto import JournalCrypto
+
+def test_first_write_uses_key_stored_by_concurrent_write(app):
+    with app.app_context():
+        session_id = str(uuid.uuid4())
+        db.session.add(UserSession(session_id=session_id))
+        db.session.commit()
+
+        # Another worker stores the session's key after this one saw none
+        winner = Fernet.generate_key()
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(JournalKey).values(
+                session_id=session_id, wrapped_key=JournalCrypto.get_master().encrypt(winner).decode()))
+
+        fernet = JournalCrypto._create_key(session_id)
+        token = fernet.encrypt(b'secret')
+        db.session.commit()
+
+        assert Fernet(winner).decrypt(token) == b'secret'
+        assert JournalKey.query.filter_by(session_id=session_id).count() == 1
+        assert JournalCrypto.get_fernet(session_id).decrypt(token) == b'secret'
+
+def test_rolled_back_key_is_not_cached(app):
+    with app.app_context():
+        session_id = str(uuid.uuid4())
+        JournalCrypto._create_key(session_id)
+        db.session.rollback()
+
+        assert JournalKey.get_wrapped_key(session_id) is None
+        assert JournalCrypto._get_cache().get(session_id) is None
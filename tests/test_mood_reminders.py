@@ -0,0 +1,15 @@
+import uuid
+from datetime import datetime
+from models import db, UserSession
+from services.wellness_tracker import WellnessTracker
+
+def test_unscheduled_sessions_are_due_for_mood_reminder(app):
+    with app.app_context():
+        session_id = str(uuid.uuid4())
+        db.session.add(UserSession(session_id=session_id))
+        db.session.commit()
+        assert UserSession.query.filter_by(session_id=session_id).one().next_mood_reminder_at is None
+
+        now = datetime.utcnow().replace(hour=12)
+        assert session_id in WellnessTracker.get_sessions_due_for_mood_reminder(now, limit=10000)
+        assert UserSession.query.filter_by(session_id=session_id).one().next_mood_reminder_at is not None
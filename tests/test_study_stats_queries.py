@@ -0,0 +1,83 @@
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db, StudySession
+from services.study_timer_service import StudyTimerService
+
+def _session_with_study(count):
+    session_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    db.session.add_all([
+        StudySession(session_id, 1500, subject=f'subject {i % 5}', start_time=now - timedelta(hours=i * 7),
+                     mood_before=5, mood_after=5 + i % 3 - 1, productivity_rating=1 + i % 5)
+        for i in range(count)
+    ])
+    db.session.commit()
+    return session_id
+
+def test_study_stats_query_count_does_not_grow_with_history(app, count_queries):
+    with app.app_context():
+        small = _session_with_study(5)
+        large = _session_with_study(2000)
+
+        counts = []
+        for session_id in (small, large):
+            # The first read builds the day bitmaps the streak comes from, since these rows skipped the events
+            StudySession.get_study_stats(session_id, 30)
+            with count_queries() as statements:
+                stats = StudySession.get_study_stats(session_id, 30)
+            counts.append(len(statements))
+
+    assert stats['total_sessions'] > 0
+    # Subject totals, the streak's day bitmaps and the best hour: one query each
+    assert counts == [3, 3]
+
+def test_study_stats_read_only_the_session_rows_through_indexes(app):
+    with app.app_context():
+        # 10k sessions of history for this user among 10k more of other users'
+        session_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        db.session.execute(db.insert(StudySession), [
+            {'session_id': session_id if i % 2 else str(uuid.uuid4()), 'subject': f'subject {i % 5}', 'duration': 1500,
+             'start_time': now - timedelta(hours=i * 2), 'end_time': now - timedelta(hours=i * 2) + timedelta(minutes=25),
+             'mood_before': 5, 'mood_after': 5 + i % 3 - 1, 'productivity_rating': 1 + i % 5}
+            for i in range(20000)
+        ])
+        db.session.commit()
+        StudySession.get_study_stats(session_id, 30)
+
+        executed = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            executed.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            stats = StudySession.get_study_stats(session_id, 365)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        plans = [db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                 for statement, parameters in executed if 'study_sessions' in statement]
+
+    assert stats['total_sessions'] > 0
+    assert len(executed) == 3
+    assert plans
+    # Every read of study_sessions is an index search on the session, never a table scan
+    for plan in plans:
+        details = [row[-1] for row in plan if 'study_sessions' in row[-1]]
+        assert details and all(detail.startswith('SEARCH') and 'INDEX' in detail for detail in details), details
+
+def test_cached_study_stats_run_no_queries(app, count_queries):
+    with app.app_context():
+        session_id = _session_with_study(10)
+        StudyTimerService.get_study_stats(session_id)
+
+        with count_queries() as statements:
+            StudyTimerService.get_study_stats(session_id)
+        assert statements == []
+
+        StudyTimerService.invalidate_study_stats(session_id)
+        with count_queries() as statements:
+            StudyTimerService.get_study_stats(session_id)
+        assert statements